@@ -0,0 +1,166 @@
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select
+
+import models
+from visits import WriteBehindBuffer, VISITS_FLUSH_INTERVAL, VISITS_FLUSH_THRESHOLD
+
+# Сколько дней хранятся минутные и часовые корзины; дневные хранятся всегда
+ANALYTICS_MINUTE_RETENTION_DAYS = int(os.environ.get("ANALYTICS_MINUTE_RETENTION_DAYS", "2"))
+ANALYTICS_HOUR_RETENTION_DAYS = int(os.environ.get("ANALYTICS_HOUR_RETENTION_DAYS", "90"))
+ANALYTICS_COMPACT_INTERVAL = float(os.environ.get("ANALYTICS_COMPACT_INTERVAL", "3600"))
+ANALYTICS_MAX_POINTS = 2000
+# Период тренда на панели администратора
+ANALYTICS_TREND_DAYS = 30
+
+GRANULARITY_STEPS = {
+    "m": timedelta(minutes=1),
+    "h": timedelta(hours=1),
+    "d": timedelta(days=1),
+}
+
+
+def bucket_start(moment: datetime, granularity: str) -> datetime:
+    if granularity == "m":
+        return moment.replace(second=0, microsecond=0)
+    if granularity == "h":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def choose_granularity(start: datetime, end: datetime, requested: Optional[str] = None) -> str:
+    """Самая мелкая корзина, которая еще хранится и дает не больше ANALYTICS_MAX_POINTS точек"""
+    now = datetime.utcnow()
+    retention = {
+        "m": now - timedelta(days=ANALYTICS_MINUTE_RETENTION_DAYS),
+        "h": now - timedelta(days=ANALYTICS_HOUR_RETENTION_DAYS),
+        "d": datetime.min,
+    }
+    candidates = ["m", "h", "d"]
+    if requested in GRANULARITY_STEPS:
+        candidates = candidates[candidates.index(requested):]
+    for granularity in candidates:
+        if start >= retention[granularity] and (end - start) / GRANULARITY_STEPS[granularity] <= ANALYTICS_MAX_POINTS:
+            return granularity
+    return "d"
+
+
+def _upsert(dialect: str):
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    table = models.QRScanBucket.__table__
+    statement = insert(table)
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.qr_id, table.c.granularity, table.c.bucket_start],
+        set_={"count": table.c.count + statement.excluded.count},
+    )
+
+
+class ScanAnalytics(WriteBehindBuffer):
+    """Хранилище статистики сканирований по временным корзинам.
+
+    Сырые события копятся в памяти только до ближайшей записи: при flush()
+    они сворачиваются в минутные, часовые и дневные корзины (UPSERT), после
+    чего удаляются. Периодическая компактация удаляет устаревшие минутные и
+    часовые корзины, поэтому годовой график читает ~365 дневных строк.
+    """
+
+    def __init__(self, engine, interval: float = VISITS_FLUSH_INTERVAL, threshold: int = VISITS_FLUSH_THRESHOLD):
+        super().__init__(engine, interval, threshold)
+        self.compact_interval = ANALYTICS_COMPACT_INTERVAL
+        self._events: List[Tuple[str, datetime]] = []
+        self._inflight: List[Tuple[str, datetime]] = []
+        self._last_compact: Optional[datetime] = None
+
+    def record(self, qr_id: str, moment: Optional[datetime] = None):
+        self._events.append((qr_id, moment or datetime.utcnow()))
+        self._added(1)
+
+    @staticmethod
+    def rollup(events: List[Tuple[str, datetime]]) -> Counter:
+        buckets: Counter = Counter()
+        for qr_id, moment in events:
+            for granularity in GRANULARITY_STEPS:
+                buckets[(qr_id, granularity, bucket_start(moment, granularity))] += 1
+        return buckets
+
+    def _requeue_inflight(self):
+        self._events = self._inflight + self._events
+        self._pending_count += len(self._inflight)
+        self._inflight = []
+
+    async def flush(self):
+        if self._events and not self._inflight:
+            self._inflight, self._events = self._events, []
+            self._pending_count = 0
+            rows = [
+                {"qr_id": qr_id, "granularity": granularity, "bucket_start": start, "count": count}
+                for (qr_id, granularity, start), count in self.rollup(self._inflight).items()
+            ]
+            try:
+                async with self.engine.begin() as conn:
+                    await conn.execute(_upsert(self.engine.dialect.name), rows)
+            except Exception as e:
+                self.flush_errors += 1
+                self._requeue_inflight()
+                print(f"Ошибка при записи статистики сканирований: {e}")
+                return
+            self._inflight = []
+            self.flushes += 1
+
+        now = datetime.utcnow()
+        if self._last_compact is None or (now - self._last_compact).total_seconds() >= self.compact_interval:
+            await self.compact(now)
+
+    async def compact(self, now: Optional[datetime] = None):
+        """Удаляет мелкие корзины, вышедшие за срок хранения"""
+        now = now or datetime.utcnow()
+        table = models.QRScanBucket.__table__
+        try:
+            async with self.engine.begin() as conn:
+                for granularity, days in (("m", ANALYTICS_MINUTE_RETENTION_DAYS), ("h", ANALYTICS_HOUR_RETENTION_DAYS)):
+                    await conn.execute(
+                        delete(table).where(
+                            table.c.granularity == granularity,
+                            table.c.bucket_start < bucket_start(now - timedelta(days=days), granularity),
+                        )
+                    )
+        except Exception as e:
+            print(f"Ошибка при компактации статистики сканирований: {e}")
+            return
+        self._last_compact = now
+
+    async def series(self, start: datetime, end: datetime, qr_id: Optional[str] = None, granularity: Optional[str] = None) -> Dict:
+        """Временной ряд [start, end) по одному коду или по всей платформе"""
+        granularity = choose_granularity(start, end, granularity)
+        table = models.QRScanBucket.__table__
+        first = bucket_start(start, granularity)
+        query = (
+            select(table.c.bucket_start, func.sum(table.c.count))
+            .where(table.c.granularity == granularity, table.c.bucket_start >= first, table.c.bucket_start < end)
+            .group_by(table.c.bucket_start)
+            .order_by(table.c.bucket_start)
+        )
+        if qr_id is not None:
+            query = query.where(table.c.qr_id == qr_id)
+        async with self.engine.connect() as conn:
+            stored = Counter({moment: count for moment, count in (await conn.execute(query)).all()})
+
+        # Добавляем события, еще не записанные в БД
+        for event_qr_id, moment in self._inflight + self._events:
+            if (qr_id is None or event_qr_id == qr_id) and start <= moment < end:
+                stored[bucket_start(moment, granularity)] += 1
+
+        points = [{"t": moment.isoformat(), "count": count} for moment, count in sorted(stored.items())]
+        return {
+            "granularity": granularity,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "total": sum(stored.values()),
+            "points": points,
+        }
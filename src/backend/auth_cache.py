@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set
+
+# Настройки кеша проверенных токенов
+AUTH_CACHE_SIZE = int(os.environ.get("AUTH_CACHE_SIZE", "10000"))
+AUTH_CACHE_TTL = float(os.environ.get("AUTH_CACHE_TTL", "300"))
+
+
+class PrincipalCache:
+    """Ограниченный LRU-кеш пользователей по bearer-токену.
+
+    Запись живет не дольше AUTH_CACHE_TTL секунд и не дольше claim `exp`
+    самого токена. Записи пользователя можно сбросить явно (смена пароля,
+    изменение или удаление пользователя).
+    """
+
+    def __init__(self, maxsize: int = AUTH_CACHE_SIZE, ttl: float = AUTH_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._tokens_by_user: Dict[str, Set[str]] = {}
+        # Синхронные эндпоинты выполняются в пуле потоков
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[Any]:
+        """Возвращает закешированного пользователя или None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            principal, username, expires_at = entry
+            if expires_at <= now:
+                self._remove(token)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return principal
+
+    def put(self, token: str, principal: Any, username: str, exp: Optional[float] = None):
+        """Сохраняет пользователя; exp - значение claim `exp` (unix time)"""
+        expires_at = time.time() + self.ttl
+        if exp is not None:
+            expires_at = min(expires_at, float(exp))
+        if expires_at <= time.time() or self.maxsize <= 0:
+            return
+        with self._lock:
+            if token in self._entries:
+                self._remove(token)
+            self._entries[token] = (principal, username, expires_at)
+            self._tokens_by_user.setdefault(username, set()).add(token)
+            while len(self._entries) > self.maxsize:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate_user(self, username: str):
+        """Сбрасывает все токены пользователя"""
+        with self._lock:
+            for token in list(self._tokens_by_user.get(username, ())):
+                self._remove(token)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_user.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
+
+    def _remove(self, token: str):
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        username = entry[1]
+        tokens = self._tokens_by_user.get(username)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[username]
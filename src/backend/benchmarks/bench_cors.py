@@ -0,0 +1,143 @@
+"""Накладные расходы CORS на запрос: прежний стек против cors.CORSMiddleware.
+
+Прежний стек - это starlette CORSMiddleware, http-middleware add_cors_headers
+(BaseHTTPMiddleware) и маршрут OPTIONS /{path:path}. Оба варианта
+оборачивают одно и то же минимальное приложение FastAPI, запросы подаются
+напрямую через ASGI, без сети.
+
+Запуск из src/backend:
+    python benchmarks/bench_cors.py [--iterations 5000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI, Request, Response
+from fastapi.middleware.cors import CORSMiddleware as StarletteCORSMiddleware
+
+from cors import CORSMiddleware
+
+METHODS = ["GET", "POST", "PUT", "DELETE", "OPTIONS", "HEAD", "PATCH"]
+
+
+def base_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api/auth/status")
+    async def auth_status():
+        return {"error": False, "authenticated": False}
+
+    return app
+
+
+def legacy_app() -> FastAPI:
+    app = base_app()
+    app.add_middleware(
+        StarletteCORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=METHODS,
+        allow_headers=["*"],
+        expose_headers=["*"],
+        max_age=3600,
+    )
+
+    @app.middleware("http")
+    async def add_cors_headers(request: Request, call_next):
+        response = await call_next(request)
+        response.headers["Access-Control-Allow-Origin"] = "*"
+        response.headers["Access-Control-Allow-Methods"] = ", ".join(METHODS)
+        response.headers["Access-Control-Allow-Headers"] = "*"
+        response.headers["Access-Control-Allow-Credentials"] = "true"
+        response.headers["Access-Control-Max-Age"] = "3600"
+        return response
+
+    @app.options("/{path:path}")
+    async def options_route(path: str, response: Response):
+        return {}
+
+    return app
+
+
+def new_app() -> FastAPI:
+    app = base_app()
+    app.add_middleware(CORSMiddleware, allow_origins=["*"])
+    return app
+
+
+def make_scope(method: str, headers):
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": "/api/auth/status",
+        "raw_path": b"/api/auth/status",
+        "root_path": "",
+        "query_string": b"",
+        "headers": headers,
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+
+
+REQUESTS = {
+    "GET без Origin": ("GET", [(b"host", b"testserver")]),
+    "GET с Origin": ("GET", [(b"host", b"testserver"), (b"origin", b"https://socialqr.example")]),
+    "preflight": (
+        "OPTIONS",
+        [
+            (b"host", b"testserver"),
+            (b"origin", b"https://socialqr.example"),
+            (b"access-control-request-method", b"GET"),
+            (b"access-control-request-headers", b"authorization"),
+        ],
+    ),
+}
+
+
+async def call(app, scope) -> int:
+    status = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def measure(app, method, headers, iterations: int) -> float:
+    scope = make_scope(method, headers)
+    # Прогрев: сборка стека middleware при первом вызове
+    assert await call(app, dict(scope)) == 200
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await call(app, dict(scope))
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+async def main(iterations: int):
+    bare, legacy, new = base_app(), legacy_app(), new_app()
+    print(f"{'запрос':<16}{'без CORS, мкс':>15}{'прежний, мкс':>15}{'новый, мкс':>13}")
+    for name, (method, headers) in REQUESTS.items():
+        bare_us = await measure(bare, method, headers, iterations) if method == "GET" else float("nan")
+        legacy_us = await measure(legacy, method, headers, iterations)
+        new_us = await measure(new, method, headers, iterations)
+        print(f"{name:<16}{bare_us:>15.1f}{legacy_us:>15.1f}{new_us:>13.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(main(args.iterations))
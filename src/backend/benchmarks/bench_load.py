@@ -0,0 +1,477 @@
+"""Нагрузочный тест API: пропускная способность и p50/p95/p99 по маршрутам.
+
+Оба приложения (main_app и main.py.fixed) запускаются в этом же процессе и
+вызываются через ASGI-транспорт httpx, без сети. Перед прогоном создается
+временная SQLite-база с заданным числом пользователей, виджетов, подписок и
+QR-кодов. Каждый сценарий - взвешенная смесь запросов, которую выполняют
+--concurrency параллельных клиентов:
+
+    qr-scan           переходы по QR-кодам, публичные страницы, изображения
+    constructor-save  сохранение страниц конструктора (виджеты)
+    admin-browse      админ-панель: дашборд, списки пользователей и QR-кодов
+    login-burst       вход по паролю (bcrypt)
+
+Результаты сохраняются в JSON (--output) для сравнения прогонов; --compare
+печатает изменения относительно прежнего файла, а --max-regression
+завершает скрипт с ошибкой, если p95 какого-либо маршрута вырос сильнее.
+
+Нужен httpx (pip install httpx). Запуск из src/backend:
+    python benchmarks/bench_load.py [--scenario qr-scan] [--concurrency 32] [--duration 10]
+        [--users 200] [--widgets 10] [--subscriptions 0.8] [--qrcodes 500]
+        [--output load_results.json] [--compare baseline.json] [--max-regression 20]
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib.machinery
+import importlib.util
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+BENCH_PASSWORD = "bench-password"
+MAIN_APP = "main_app"
+FIXED_APP = "main.py.fixed"
+
+
+def configure_environment(db_path: str, bcrypt_rounds: Optional[int]):
+    """Настройки читаются модулями при импорте, поэтому задаются до него"""
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["DB_AUTO_MIGRATE"] = "true"
+    if bcrypt_rounds:
+        os.environ["BCRYPT_ROUNDS"] = str(bcrypt_rounds)
+    # Лимиты входа меряют не API, а защиту от перебора: для теста их снимаем
+    for name in ("RATE_LIMIT_IP_PER_MINUTE", "RATE_LIMIT_IP_BURST", "RATE_LIMIT_USER_PER_MINUTE", "RATE_LIMIT_USER_BURST"):
+        os.environ.setdefault(name, "1000000")
+
+
+class Fixture:
+    """Данные, созданные при заполнении БД, и токены для запросов"""
+
+    def __init__(self):
+        self.usernames: List[str] = []
+        self.user_ids: Dict[str, int] = {}
+        self.widget_ids: Dict[str, List[int]] = {}
+        self.qr_ids: List[str] = []
+        self.main_tokens: Dict[str, str] = {}
+        self.fixed_tokens: Dict[str, str] = {}
+
+
+def seed(fixture: Fixture, users: int, widgets: int, subscriptions: float, qrcodes: int, rng: random.Random):
+    """Заполняет БД пакетными INSERT; все пользователи получают один пароль"""
+    from sqlalchemy import insert, select
+
+    import database
+    import migrate
+    import models
+    from hashing import get_pwd_context
+
+    migrate.run()
+    hashed_password = get_pwd_context().hash(BENCH_PASSWORD)
+    now = datetime.utcnow()
+    usernames = ["admin"] + [f"user{index:05d}" for index in range(1, users)]
+    with database.get_engine().begin() as conn:
+        conn.execute(insert(models.User.__table__), [
+            {
+                "username": username,
+                "name": username.title(),
+                "email": f"{username}@example.com",
+                "hashed_password": hashed_password,
+                "is_admin": username == "admin",
+                "disabled": False,
+                "created_at": now,
+            }
+            for username in usernames
+        ])
+        rows = conn.execute(select(models.User.__table__.c.id, models.User.__table__.c.username)).all()
+        user_ids = {username: user_id for user_id, username in rows}
+
+        subscribed = rng.sample(usernames, int(len(usernames) * subscriptions))
+        if subscribed:
+            conn.execute(insert(models.Subscription.__table__), [
+                {
+                    "user_id": user_ids[username],
+                    "activation_date": now - timedelta(days=rng.randint(0, 300)),
+                    "expiration_date": now + timedelta(days=rng.randint(-30, 365)),
+                    "is_active": rng.random() < 0.9,
+                }
+                for username in subscribed
+            ])
+
+        if widgets:
+            conn.execute(insert(models.Widget.__table__), [
+                {
+                    "type": rng.choice(["text", "image", "video"]),
+                    "content": {"text": f"Виджет {index}", "style": {"size": rng.randint(10, 40)}},
+                    "position_x": rng.uniform(0, 100),
+                    "position_y": rng.uniform(0, 100),
+                    "width": 20.0,
+                    "height": 10.0,
+                    "anchor": "center",
+                    "user_id": user_ids[username],
+                    "created_at": now,
+                    "updated_at": now,
+                }
+                for username in usernames
+                for index in range(widgets)
+            ])
+        widget_ids: Dict[str, List[int]] = {}
+        id_to_name = {user_id: username for username, user_id in user_ids.items()}
+        for widget_id, user_id in conn.execute(select(models.Widget.__table__.c.id, models.Widget.__table__.c.user_id)):
+            widget_ids.setdefault(id_to_name[user_id], []).append(widget_id)
+
+        qr_ids = [f"bench{index:06d}" for index in range(qrcodes)]
+        if qr_ids:
+            conn.execute(insert(models.QRCode.__table__), [
+                {
+                    "slug": qr_id,
+                    "owner": rng.choice(usernames),
+                    "url": f"https://example.com/memory/{qr_id}",
+                    "title": f"QR {qr_id}",
+                    "created_at": now,
+                }
+                for qr_id in qr_ids
+            ])
+
+    fixture.usernames = usernames
+    fixture.user_ids = user_ids
+    fixture.widget_ids = widget_ids
+    fixture.qr_ids = qr_ids
+
+
+def load_fixed_app():
+    """main.py.fixed не импортируется по имени - загружаем файл явно"""
+    path = os.path.join(BACKEND_DIR, "main.py.fixed")
+    loader = importlib.machinery.SourceFileLoader("main_fixed", path)
+    spec = importlib.util.spec_from_loader("main_fixed", loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["main_fixed"] = module
+    loader.exec_module(module)
+    return module
+
+
+def issue_tokens(fixture: Fixture, main_app, main_fixed):
+    """Токены выпускаются напрямую, чтобы подготовка не упиралась в bcrypt"""
+    for username in fixture.usernames:
+        fixture.main_tokens[username] = main_app.create_access_token({"sub": username}, timedelta(days=1))
+        fixture.fixed_tokens[username] = main_fixed.create_access_token({"sub": username})
+
+
+# Запрос сценария: (приложение, метод, шаблон маршрута, URL, параметры httpx, ожидаемые статусы)
+Call = Tuple[str, str, str, str, dict, Tuple[int, ...]]
+
+
+def bearer(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def qr_scan(fixture: Fixture, rng: random.Random) -> Call:
+    qr_id = rng.choice(fixture.qr_ids)
+    return MAIN_APP, "GET", "/q/{qr_id}", f"/q/{qr_id}", {}, (302,)
+
+
+def public_page(fixture: Fixture, rng: random.Random) -> Call:
+    username = rng.choice(fixture.usernames)
+    return FIXED_APP, "GET", "/public/{username}", f"/public/{username}", {}, (200,)
+
+
+def qr_image(fixture: Fixture, rng: random.Random) -> Call:
+    qr_id = rng.choice(fixture.qr_ids)
+    return MAIN_APP, "GET", "/api/qrcodes/{qr_id}/image", f"/api/qrcodes/{qr_id}/image", {}, (200,)
+
+
+def list_widgets(fixture: Fixture, rng: random.Random) -> Call:
+    username = rng.choice(fixture.usernames)
+    return FIXED_APP, "GET", "/widgets", "/widgets", {"headers": bearer(fixture.fixed_tokens[username])}, (200,)
+
+
+def save_page(fixture: Fixture, rng: random.Random) -> Call:
+    """Перетаскивание виджетов: пакетное обновление позиций"""
+    username = rng.choice([name for name in fixture.usernames if fixture.widget_ids.get(name)])
+    moved = rng.sample(fixture.widget_ids[username], min(3, len(fixture.widget_ids[username])))
+    batch = {"update": [{"id": widget_id, "position_x": rng.uniform(0, 100), "position_y": rng.uniform(0, 100)} for widget_id in moved]}
+    return FIXED_APP, "POST", "/widgets/batch", "/widgets/batch", {"json": batch, "headers": bearer(fixture.fixed_tokens[username])}, (200,)
+
+
+def edit_widget(fixture: Fixture, rng: random.Random) -> Call:
+    username = rng.choice([name for name in fixture.usernames if fixture.widget_ids.get(name)])
+    widget_id = rng.choice(fixture.widget_ids[username])
+    body = {"content": {"text": f"Правка {rng.randint(0, 10 ** 6)}"}}
+    return FIXED_APP, "PUT", "/widgets/{widget_id}", f"/widgets/{widget_id}", {"json": body, "headers": bearer(fixture.fixed_tokens[username])}, (200,)
+
+
+def patch_widget(fixture: Fixture, rng: random.Random) -> Call:
+    """Правка одного поля контента без пересылки всего контента"""
+    username = rng.choice([name for name in fixture.usernames if fixture.widget_ids.get(name)])
+    widget_id = rng.choice(fixture.widget_ids[username])
+    body = {"content_patch": [{"op": "replace", "path": "/style/size", "value": rng.randint(10, 40)}]}
+    return FIXED_APP, "PATCH", "/widgets/{widget_id}", f"/widgets/{widget_id}", {"json": body, "headers": bearer(fixture.fixed_tokens[username])}, (200,)
+
+
+def add_widget(fixture: Fixture, rng: random.Random) -> Call:
+    username = rng.choice(fixture.usernames)
+    body = {"type": "text", "content": {"text": "Новый виджет"}, "position_x": 50.0, "position_y": 50.0, "width": 20.0, "height": 10.0}
+    return FIXED_APP, "POST", "/widgets", "/widgets", {"json": body, "headers": bearer(fixture.fixed_tokens[username])}, (200,)
+
+
+def admin_dashboard(fixture: Fixture, rng: random.Random) -> Call:
+    return MAIN_APP, "GET", "/api/admin/dashboard", "/api/admin/dashboard", {"headers": bearer(fixture.main_tokens["admin"])}, (200,)
+
+
+def admin_users(fixture: Fixture, rng: random.Random) -> Call:
+    return MAIN_APP, "GET", "/api/admin/users", "/api/admin/users", {"headers": bearer(fixture.main_tokens["admin"])}, (200,)
+
+
+def admin_qrcodes(fixture: Fixture, rng: random.Random) -> Call:
+    owner = rng.choice(fixture.usernames)
+    return MAIN_APP, "GET", "/api/admin/qrcodes", f"/api/admin/qrcodes?owner={owner}", {"headers": bearer(fixture.main_tokens["admin"])}, (200,)
+
+
+def admin_users_page(fixture: Fixture, rng: random.Random) -> Call:
+    """Страница списка с фильтром по подписке, курсор - случайный пользователь"""
+    cursor = rng.choice(list(fixture.user_ids.values()))
+    subscription = rng.choice(["active", "expired", "none"])
+    url = f"/admin/users?limit=50&cursor={cursor}&subscription={subscription}"
+    return FIXED_APP, "GET", "/admin/users", url, {"headers": bearer(fixture.fixed_tokens["admin"])}, (200,)
+
+
+def auth_status(fixture: Fixture, rng: random.Random) -> Call:
+    username = rng.choice(fixture.usernames)
+    return MAIN_APP, "GET", "/api/auth/status", "/api/auth/status", {"headers": bearer(fixture.main_tokens[username])}, (200,)
+
+
+def login(fixture: Fixture, rng: random.Random) -> Call:
+    username = rng.choice(fixture.usernames)
+    body = {"username": username, "password": BENCH_PASSWORD}
+    return MAIN_APP, "POST", "/api/auth/login", "/api/auth/login", {"json": body}, (200,)
+
+
+def token_login(fixture: Fixture, rng: random.Random) -> Call:
+    username = rng.choice(fixture.usernames)
+    body = {"username": username, "password": BENCH_PASSWORD}
+    return FIXED_APP, "POST", "/token", "/token", {"data": body}, (200,)
+
+
+SCENARIOS: Dict[str, List[Tuple[int, Callable[[Fixture, random.Random], Call]]]] = {
+    "qr-scan": [(6, qr_scan), (3, public_page), (1, qr_image)],
+    "constructor-save": [(3, list_widgets), (4, save_page), (1, edit_widget), (1, patch_widget), (1, add_widget)],
+    "admin-browse": [(2, admin_dashboard), (1, admin_users), (2, admin_qrcodes), (2, admin_users_page), (3, auth_status)],
+    "login-burst": [(1, login), (1, token_login)],
+}
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Перцентиль по методу ближайшего ранга"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: Dict[str, List[float]], statuses: Dict[str, Dict[int, int]], errors: Dict[str, int], exceptions: Dict[str, Dict[str, int]], elapsed: float) -> dict:
+    routes = {}
+    for route, values in sorted(latencies.items()):
+        values.sort()
+        routes[route] = {
+            "requests": len(values),
+            "errors": errors.get(route, 0),
+            "throughput_rps": round(len(values) / elapsed, 2),
+            "mean_ms": round(sum(values) / len(values), 3),
+            "p50_ms": round(percentile(values, 0.50), 3),
+            "p95_ms": round(percentile(values, 0.95), 3),
+            "p99_ms": round(percentile(values, 0.99), 3),
+            "max_ms": round(values[-1], 3),
+            "status": {str(code): count for code, count in sorted(statuses[route].items())},
+        }
+        if route in exceptions:
+            routes[route]["exceptions"] = exceptions[route]
+    total = sum(route["requests"] for route in routes.values())
+    return {
+        "duration_s": round(elapsed, 3),
+        "requests": total,
+        "errors": sum(route["errors"] for route in routes.values()),
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "routes": routes,
+    }
+
+
+async def run_scenario(clients, fixture: Fixture, mix, concurrency: int, duration: float, requests: int, rng: random.Random) -> dict:
+    weights = [weight for weight, _ in mix]
+    builders = [builder for _, builder in mix]
+    latencies: Dict[str, List[float]] = {}
+    statuses: Dict[str, Dict[int, int]] = {}
+    errors: Dict[str, int] = {}
+    exceptions: Dict[str, Dict[str, int]] = {}
+    issued = 0
+    deadline = time.perf_counter() + duration
+
+    async def client_loop(worker_rng: random.Random):
+        nonlocal issued
+        while (issued < requests) if requests else (time.perf_counter() < deadline):
+            issued += 1
+            builder = worker_rng.choices(builders, weights)[0]
+            app, method, route, url, kwargs, expected = builder(fixture, worker_rng)
+            key = f"{app} {method} {route}"
+            started = time.perf_counter()
+            try:
+                response = await clients[app].request(method, url, **kwargs)
+                status = response.status_code
+            except Exception as e:
+                # Исключение, дошедшее до клиента, - статус 0 и имя класса в отчете
+                status = 0
+                route_exceptions = exceptions.setdefault(key, {})
+                route_exceptions[type(e).__name__] = route_exceptions.get(type(e).__name__, 0) + 1
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            latencies.setdefault(key, []).append(elapsed_ms)
+            route_statuses = statuses.setdefault(key, {})
+            route_statuses[status] = route_statuses.get(status, 0) + 1
+            if status not in expected:
+                errors[key] = errors.get(key, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client_loop(random.Random(rng.random())) for _ in range(concurrency)))
+    return summarize(latencies, statuses, errors, exceptions, time.perf_counter() - started)
+
+
+def print_summary(name: str, result: dict):
+    print(f"\n{name}: {result['requests']} запросов за {result['duration_s']} с, "
+          f"{result['throughput_rps']} запр/с, ошибок {result['errors']}")
+    print(f"  {'маршрут':<46}{'запр/с':>9}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}{'ошибок':>8}")
+    for route, stats in result["routes"].items():
+        print(f"  {route:<46}{stats['throughput_rps']:>9.1f}{stats['p50_ms']:>10.2f}"
+              f"{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}{stats['errors']:>8}")
+
+
+def compare(current: dict, baseline: dict, max_regression: float) -> bool:
+    """Печатает изменения p95 и пропускной способности; True, если есть регрессия сверх порога"""
+    regressed = False
+    print("\nСравнение с прежним прогоном (p95 и запр/с, изменение в %):")
+    for name, result in current["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            continue
+        for route, stats in result["routes"].items():
+            old = previous["routes"].get(route)
+            if old is None or not old["p95_ms"] or not old["throughput_rps"]:
+                continue
+            p95_change = (stats["p95_ms"] / old["p95_ms"] - 1) * 100
+            rps_change = (stats["throughput_rps"] / old["throughput_rps"] - 1) * 100
+            flag = ""
+            if max_regression and p95_change > max_regression:
+                flag = "  <- регрессия"
+                regressed = True
+            print(f"  {name:<18}{route:<46}{p95_change:>+8.1f}%{rps_change:>+8.1f}%{flag}")
+    return regressed
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args) -> int:
+    workdir = tempfile.mkdtemp(prefix="socialqr-bench-")
+    try:
+        return await run(args, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+async def run(args, workdir: str) -> int:
+    configure_environment(os.path.join(workdir, "bench.db"), args.bcrypt_rounds)
+    rng = random.Random(args.seed)
+
+    import httpx
+
+    fixture = Fixture()
+    # Приложения печатают в stdout на каждый вход и запрос списка - на время теста глушим
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        seed(fixture, args.users, args.widgets, args.subscriptions, args.qrcodes, rng)
+        import main_app
+        main_fixed = load_fixed_app()
+    issue_tokens(fixture, main_app, main_fixed)
+
+    results = {}
+    async with main_app.app.router.lifespan_context(main_app.app):
+        clients = {
+            MAIN_APP: httpx.AsyncClient(transport=httpx.ASGITransport(app=main_app.app), base_url="http://bench"),
+            FIXED_APP: httpx.AsyncClient(transport=httpx.ASGITransport(app=main_fixed.app), base_url="http://bench"),
+        }
+        try:
+            for name in args.scenario or list(SCENARIOS):
+                with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                    if args.warmup:
+                        await run_scenario(clients, fixture, SCENARIOS[name], args.concurrency, 0, args.warmup, rng)
+                    result = await run_scenario(clients, fixture, SCENARIOS[name], args.concurrency, args.duration, args.requests, rng)
+                results[name] = result
+                print_summary(name, result)
+        finally:
+            for client in clients.values():
+                await client.aclose()
+
+    report = {
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "users": args.users,
+            "widgets_per_user": args.widgets,
+            "subscriptions": args.subscriptions,
+            "qrcodes": args.qrcodes,
+            "bcrypt_rounds": int(os.environ.get("BCRYPT_ROUNDS", "12")),
+            "seed": args.seed,
+        },
+        "scenarios": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as output:
+        json.dump(report, output, ensure_ascii=False, indent=2)
+    print(f"\nРезультаты записаны в {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        if compare(report, baseline, args.max_regression):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="сценарий (по умолчанию все)")
+    parser.add_argument("--concurrency", type=int, default=32, help="число параллельных клиентов")
+    parser.add_argument("--duration", type=float, default=10, help="длительность сценария в секундах")
+    parser.add_argument("--requests", type=int, default=0, help="число запросов на сценарий вместо длительности")
+    parser.add_argument("--warmup", type=int, default=200, help="запросов прогрева перед замером")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--widgets", type=int, default=10, help="виджетов на пользователя")
+    parser.add_argument("--subscriptions", type=float, default=0.8, help="доля пользователей с подпиской")
+    parser.add_argument("--qrcodes", type=int, default=500)
+    parser.add_argument("--bcrypt-rounds", type=int, default=0, help="стоимость bcrypt (по умолчанию BCRYPT_ROUNDS)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="load_results.json")
+    parser.add_argument("--compare", help="JSON прежнего прогона для сравнения")
+    parser.add_argument("--max-regression", type=float, default=0, help="допустимый рост p95 в %% при --compare")
+    args = parser.parse_args()
+    if args.users < 1:
+        parser.error("--users должно быть не меньше 1 (включая администратора)")
+    sys.exit(asyncio.run(main(args)))
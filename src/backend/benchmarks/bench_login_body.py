@@ -0,0 +1,116 @@
+"""Микробенчмарк разбора тела запроса входа.
+
+Сравнивает прежнюю цепочку request.json() -> request.form() -> split('&')
+с однопроходным parse_login_body для каждого формата и проверяет,
+что оба способа извлекают одинаковые логин и пароль.
+
+Запуск из src/backend:
+    python benchmarks/bench_login_body.py [--iterations 20000] [--max-us 50]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from starlette.requests import Request
+
+import login_body
+
+BOUNDARY = "----bench7MA4YWxkTrZu0gW"
+
+CASES = {
+    "json": ("application/json", b'{"username": "admin", "password": "admin"}'),
+    "urlencoded": ("application/x-www-form-urlencoded", b"username=admin&password=admin"),
+    "multipart": (
+        f"multipart/form-data; boundary={BOUNDARY}",
+        (
+            f"--{BOUNDARY}\r\n"
+            'Content-Disposition: form-data; name="username"\r\n\r\nadmin\r\n'
+            f"--{BOUNDARY}\r\n"
+            'Content-Disposition: form-data; name="password"\r\n\r\nadmin\r\n'
+            f"--{BOUNDARY}--\r\n"
+        ).encode("utf-8"),
+    ),
+    "text/plain json": ("text/plain", b'{"username": "admin", "password": "admin"}'),
+}
+
+
+def make_request(content_type: str, body: bytes) -> Request:
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/api/auth/login",
+        "headers": [(b"content-type", content_type.encode("latin-1")), (b"content-length", str(len(body)).encode())],
+    }
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            return {"type": "http.disconnect"}
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    return Request(scope, receive)
+
+
+async def legacy_parse(request: Request) -> dict:
+    """Разбор из прежней версии universal_login"""
+    body = await request.body()
+    try:
+        data = await request.json()
+    except Exception:
+        try:
+            data = dict(await request.form())
+        except Exception:
+            body_str = body.decode("utf-8")
+            data = {}
+            if "&" in body_str:
+                for pair in body_str.split("&"):
+                    if "=" in pair:
+                        key, value = pair.split("=", 1)
+                        data[key] = value
+    return data
+
+
+async def single_pass(request: Request) -> dict:
+    body = await request.body()
+    return login_body.parse_login_body(login_body.content_type(request), body)
+
+
+async def measure(parse, content_type: str, body: bytes, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await parse(make_request(content_type, body))
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+async def main(iterations: int, max_us: float) -> int:
+    failed = False
+    print(f"{'формат':<18}{'прежний, мкс':>14}{'новый, мкс':>14}{'ускорение':>12}")
+    for name, (content_type, body) in CASES.items():
+        expected = await legacy_parse(make_request(content_type, body))
+        actual = await single_pass(make_request(content_type, body))
+        credentials = (actual or {}).get("username"), (actual or {}).get("password")
+        if credentials != ("admin", "admin"):
+            print(f"{name}: неверный результат разбора {actual!r} (прежний: {expected!r})")
+            failed = True
+            continue
+        legacy = await measure(legacy_parse, content_type, body, iterations)
+        new = await measure(single_pass, content_type, body, iterations)
+        print(f"{name:<18}{legacy:>14.2f}{new:>14.2f}{legacy / new:>11.1f}x")
+        if max_us and new > max_us:
+            print(f"{name}: {new:.2f} мкс превышает порог {max_us} мкс")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--max-us", type=float, default=0, help="порог времени разбора для проверки регрессий")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.iterations, args.max_us)))
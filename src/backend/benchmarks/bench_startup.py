@@ -0,0 +1,104 @@
+"""Холодный старт приложений и отчет о времени импорта (-X importtime).
+
+Каждый вариант запускается в новом интерпретаторе, как при холодном старте
+serverless-функции: время от начала импорта до готового объекта приложения
+берется как медиана по нескольким запускам. Для последнего запуска печатаются
+модули с наибольшим суммарным временем импорта (cumulative, в мс) и с
+наибольшим собственным временем (self) - они показывают, что стоит
+импортировать лениво.
+
+Запуск из src/backend:
+    python benchmarks/bench_startup.py [--runs 5] [--top 15] [--target serverless-render] [--max-ms 800]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = {
+    "main_app": "import main_app; app = main_app.app",
+    "serverless": "import serverless; app = serverless.create_app()",
+    "serverless-render": "import serverless; app = serverless.create_app(['health', 'render'])",
+    "serverless-scan": "import serverless; app = serverless.create_app(['scan'])",
+}
+
+RUNNER = """
+import time
+started = time.perf_counter()
+{code}
+print((time.perf_counter() - started) * 1000)
+"""
+
+
+def run_once(code: str) -> Tuple[float, str]:
+    """Время старта в мс и вывод -X importtime одного запуска"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", RUNNER.format(code=code)],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def parse_importtime(report: str) -> List[Tuple[str, int, float, float]]:
+    """Строки "import time: self | cumulative | name" -> (имя, глубина, self мс, cumulative мс)"""
+    modules = []
+    for line in report.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((name.strip(), depth, int(self_us) / 1000, int(cumulative_us) / 1000))
+    return modules
+
+
+def print_report(modules: List[Tuple[str, int, float, float]], top: int):
+    # Модули первого уровня импортированы самим кодом старта: их cumulative не пересекаются
+    first_level = sorted((m for m in modules if m[1] == 1), key=lambda m: m[3], reverse=True)
+    print(f"  {'импорт первого уровня':<40}{'cumulative, мс':>16}")
+    for name, _, _, cumulative in first_level[:top]:
+        print(f"  {name:<40}{cumulative:>16.1f}")
+    by_self = sorted(modules, key=lambda m: m[2], reverse=True)
+    print(f"  {'собственное время модуля':<40}{'self, мс':>16}")
+    for name, _, self_ms, _ in by_self[:top]:
+        print(f"  {name:<40}{self_ms:>16.1f}")
+
+
+def main(runs: int, top: int, targets: List[str], max_ms: float) -> int:
+    failed = False
+    results: Dict[str, float] = {}
+    for target in targets:
+        timings = []
+        report = ""
+        for _ in range(runs):
+            elapsed, report = run_once(TARGETS[target])
+            timings.append(elapsed)
+        results[target] = statistics.median(timings)
+        modules = parse_importtime(report)
+        print(f"{target}: медиана {results[target]:.1f} мс (мин {min(timings):.1f}, макс {max(timings):.1f}), модулей {len(modules)}")
+        print_report(modules, top)
+        print()
+        if max_ms and results[target] > max_ms:
+            print(f"{target}: {results[target]:.1f} мс превышает порог {max_ms} мс")
+            failed = True
+
+    print(f"{'вариант':<22}{'старт, мс':>12}")
+    for target, elapsed in results.items():
+        print(f"{target:<22}{elapsed:>12.1f}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--target", action="append", choices=list(TARGETS), help="вариант (по умолчанию все)")
+    parser.add_argument("--max-ms", type=float, default=0, help="порог времени старта для проверки регрессий")
+    args = parser.parse_args()
+    sys.exit(main(args.runs, args.top, args.target or list(TARGETS), args.max_ms))
@@ -0,0 +1,310 @@
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from starlette.datastructures import MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard необязателен
+    zstandard = None
+
+# Ответы меньше этого размера не сжимаются: выигрыш меньше накладных расходов
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1000"))
+COMPRESSION_CACHE_MAX_BYTES = int(os.environ.get("COMPRESSION_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# Сжимаются только текстовые типы: PNG, ZIP и т.п. уже сжаты
+COMPRESSIBLE_TYPES = frozenset([
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "application/x-ndjson",
+    "image/svg+xml",
+])
+# Большие одноразовые выгрузки: сжимаются быстрым уровнем
+BULK_TYPES = frozenset(["application/x-ndjson", "text/csv"])
+
+
+class _Gzip:
+    name = "gzip"
+    # (верхняя граница размера, уровень): чем больше ответ, тем быстрее уровень
+    levels = [(64 * 1024, 6), (1024 * 1024, 5), (None, 3)]
+    cached_level = 9
+    stream_level = 5
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _Brotli:
+    name = "br"
+    levels = [(64 * 1024, 5), (1024 * 1024, 4), (None, 2)]
+    cached_level = 9
+    stream_level = 4
+
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _Zstd:
+    name = "zstd"
+    levels = [(64 * 1024, 6), (1024 * 1024, 3), (None, 1)]
+    cached_level = 12
+    stream_level = 3
+
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+# Порядок предпочтения при равном q в Accept-Encoding
+ENCODERS = {}
+if brotli is not None:
+    ENCODERS["br"] = _Brotli
+if zstandard is not None:
+    ENCODERS["zstd"] = _Zstd
+ENCODERS["gzip"] = _Gzip
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Лучшая из поддерживаемых кодировок, принятых клиентом"""
+    accepted: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    best, best_quality = None, 0.0
+    for name in ENCODERS:
+        quality = accepted.get(name, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+def is_compressible(content_type: str) -> bool:
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    if media_type == "text/event-stream":
+        return False
+    return (
+        media_type.startswith("text/")
+        or media_type in COMPRESSIBLE_TYPES
+        or media_type.endswith("+json")
+        or media_type.endswith("+xml")
+    )
+
+
+def choose_level(encoder, size: int, content_type: str) -> int:
+    if content_type.split(";", 1)[0].strip().lower() in BULK_TYPES:
+        return encoder.stream_level
+    for limit, level in encoder.levels:
+        if limit is None or size <= limit:
+            return level
+    return encoder.stream_level
+
+
+def compress(encoding: str, data: bytes, level: int) -> bytes:
+    encoder = ENCODERS[encoding](level)
+    return encoder.compress(data) + encoder.finish()
+
+
+class CompressedCache:
+    """LRU сжатых вариантов ответов с ETag, ограниченный суммарным размером"""
+
+    def __init__(self, max_bytes: int = COMPRESSION_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str, str], bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key, body: bytes):
+        if len(body) > self.max_bytes // 4:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= len(previous)
+            self._entries[key] = body
+            self.bytes += len(body)
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= len(evicted)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "encodings": list(ENCODERS),
+        }
+
+
+class CompressionMiddleware:
+    """ASGI-сжатие ответов вместо GZipMiddleware.
+
+    - кодировка выбирается по Accept-Encoding: br и zstd, если установлены
+      соответствующие пакеты, иначе gzip;
+    - сжимаются только текстовые типы не меньше min_size; PNG, ZIP и ответы
+      с готовым Content-Encoding проходят как есть;
+    - уровень зависит от размера и типа: большие ответы и выгрузки сжимаются
+      быстрее, ответы с ETag - сильнее, но один раз: результат кешируется
+      по (путь, ETag, кодировка);
+    - потоковые ответы сжимаются по частям, без накопления в памяти.
+    """
+
+    def __init__(self, app, min_size: int = COMPRESSION_MIN_SIZE, cache: Optional[CompressedCache] = None):
+        self.app = app
+        self.min_size = min_size
+        self.cache = cache
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = choose_encoding(accept_encoding) if accept_encoding else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(send, encoding, self.min_size, self.cache, scope["path"])
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, send, encoding: str, min_size: int, cache: Optional[CompressedCache], path: str):
+        self._send = send
+        self.encoding = encoding
+        self.min_size = min_size
+        self.cache = cache
+        self.path = path
+        self.start: Optional[dict] = None
+        self.headers: Optional[MutableHeaders] = None
+        self.passthrough = False
+        self.encoder = None
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            self.start = message
+            self.headers = MutableHeaders(raw=list(message.get("headers", ())))
+            content_length = self.headers.get("content-length")
+            self.passthrough = (
+                message["status"] < 200
+                or message["status"] in (204, 304)
+                or "content-encoding" in self.headers
+                or not is_compressible(self.headers.get("content-type", ""))
+                or (content_length is not None and content_length.isdigit() and int(content_length) < self.min_size)
+            )
+            if self.passthrough:
+                await self._send(message)
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.encoder is None and not more_body:
+            await self._send_whole(body)
+            return
+
+        if self.encoder is None:
+            # Потоковый ответ: итоговый размер неизвестен
+            encoder_class = ENCODERS[self.encoding]
+            self.encoder = encoder_class(encoder_class.stream_level)
+            self._set_encoding_headers()
+            del self.headers["content-length"]
+            await self._send(self._start_message())
+
+        data = self.encoder.compress(body) if body else b""
+        if not more_body:
+            data += self.encoder.finish()
+        if data or not more_body:
+            await self._send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+    async def _send_whole(self, body: bytes):
+        if len(body) < self.min_size:
+            await self._send(self.start)
+            await self._send({"type": "http.response.body", "body": body})
+            return
+
+        etag = self.headers.get("etag")
+        key = (self.path, etag, self.encoding) if etag and self.cache is not None else None
+        compressed = self.cache.get(key) if key else None
+        if compressed is None:
+            content_type = self.headers.get("content-type", "")
+            encoder_class = ENCODERS[self.encoding]
+            level = encoder_class.cached_level if key else choose_level(encoder_class, len(body), content_type)
+            compressed = compress(self.encoding, body, level)
+            if key:
+                self.cache.put(key, compressed)
+
+        self._set_encoding_headers()
+        self.headers["content-length"] = str(len(compressed))
+        await self._send(self._start_message())
+        await self._send({"type": "http.response.body", "body": compressed})
+
+    def _set_encoding_headers(self):
+        self.headers["content-encoding"] = self.encoding
+        self.headers.add_vary_header("Accept-Encoding")
+        # Сжатое представление побайтно отличается от исходного: ETag становится слабым
+        etag = self.headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            self.headers["etag"] = "W/" + etag
+
+    def _start_message(self) -> dict:
+        message = dict(self.start)
+        message["headers"] = self.headers.raw
+        return message
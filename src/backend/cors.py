@@ -0,0 +1,104 @@
+import os
+from typing import Iterable, List, Tuple
+
+# Разрешенные источники через запятую; * - любой источник
+CORS_ALLOW_ORIGINS = os.environ.get("CORS_ALLOW_ORIGINS", "*")
+CORS_ALLOW_CREDENTIALS = os.environ.get("CORS_ALLOW_CREDENTIALS", "true").lower() in ("1", "true", "yes")
+CORS_MAX_AGE = int(os.environ.get("CORS_MAX_AGE", "3600"))
+
+CORS_ALLOW_METHODS = ["GET", "POST", "PUT", "DELETE", "OPTIONS", "HEAD", "PATCH"]
+
+Headers = List[Tuple[bytes, bytes]]
+
+
+def _header_value(values: Iterable[str]) -> bytes:
+    return ", ".join(values).encode("latin-1")
+
+
+class CORSMiddleware:
+    """Единственный слой CORS, реализованный как чистое ASGI-middleware.
+
+    Все постоянные заголовки собираются в кортежи байтов один раз при
+    создании; на запрос остается только подставить Origin. Preflight-запросы
+    (OPTIONS) отвечаются здесь же и не доходят до маршрутизации. Запросы без
+    Origin (не из браузера) проходят без изменений. Потоковые ответы не
+    буферизуются: меняется только сообщение http.response.start.
+    """
+
+    def __init__(
+        self,
+        app,
+        allow_origins: Iterable[str] = (),
+        allow_methods: Iterable[str] = CORS_ALLOW_METHODS,
+        allow_credentials: bool = CORS_ALLOW_CREDENTIALS,
+        expose_headers: Iterable[str] = ("*",),
+        max_age: int = CORS_MAX_AGE,
+    ):
+        self.app = app
+        origins = list(allow_origins) or [origin.strip() for origin in CORS_ALLOW_ORIGINS.split(",") if origin.strip()]
+        self.allow_all = "*" in origins
+        self.origins = frozenset(origin.encode("latin-1") for origin in origins)
+
+        common: Headers = [(b"vary", b"Origin")]
+        if allow_credentials:
+            common.append((b"access-control-allow-credentials", b"true"))
+        self.simple_headers: Headers = common + [(b"access-control-expose-headers", _header_value(expose_headers))]
+        self.preflight_headers: Headers = common + [
+            (b"access-control-allow-methods", _header_value(allow_methods)),
+            (b"access-control-max-age", str(max_age).encode("latin-1")),
+            (b"content-length", b"0"),
+        ]
+
+    def is_allowed(self, origin: bytes) -> bool:
+        return self.allow_all or origin in self.origins
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        origin = None
+        request_headers = None
+        for name, value in scope["headers"]:
+            if name == b"origin":
+                origin = value
+            elif name == b"access-control-request-headers":
+                request_headers = value
+
+        if scope["method"] == "OPTIONS":
+            await self.preflight(origin, request_headers, send)
+            return
+
+        if origin is None or not self.is_allowed(origin):
+            await self.app(scope, receive, send)
+            return
+
+        # Origin отражается, а не заменяется на *: иначе браузер отклонит запрос с credentials
+        cors_headers = [(b"access-control-allow-origin", origin)] + self.simple_headers
+
+        async def send_with_cors(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", ())) + cors_headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
+
+    async def preflight(self, origin, request_headers, send):
+        if origin is not None and not self.is_allowed(origin):
+            body = b"Disallowed CORS origin"
+            await send({
+                "type": "http.response.start",
+                "status": 400,
+                "headers": [(b"content-type", b"text/plain; charset=utf-8"), (b"content-length", str(len(body)).encode("latin-1"))],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        headers = list(self.preflight_headers)
+        if origin is not None:
+            headers.append((b"access-control-allow-origin", origin))
+        # Разрешаем ровно запрошенные заголовки: * не покрывает Authorization
+        if request_headers:
+            headers.append((b"access-control-allow-headers", request_headers))
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": b""})
@@ -0,0 +1,97 @@
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime
+from typing import Any, AsyncIterator, Dict, Iterable, List, Union
+
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+# Строк в одном отправляемом куске: меньше системных вызовов, память остается постоянной
+EXPORT_CHUNK_ROWS = 500
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+Rows = Union[Iterable[Dict[str, Any]], AsyncIterator[Dict[str, Any]]]
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+async def _iterate(rows: Rows) -> AsyncIterator[Dict[str, Any]]:
+    if hasattr(rows, "__aiter__"):
+        async for row in rows:
+            yield row
+    else:
+        for row in rows:
+            yield row
+
+
+async def ndjson_chunks(rows: Rows) -> AsyncIterator[bytes]:
+    """По одному JSON-объекту на строку"""
+    batch: List[str] = []
+    async for row in _iterate(rows):
+        batch.append(json.dumps(row, ensure_ascii=False, default=_json_default))
+        if len(batch) >= EXPORT_CHUNK_ROWS:
+            yield ("\n".join(batch) + "\n").encode("utf-8")
+            batch = []
+    if batch:
+        yield ("\n".join(batch) + "\n").encode("utf-8")
+
+
+async def csv_chunks(rows: Rows, fields: List[str]) -> AsyncIterator[bytes]:
+    """CSV с заголовком; буфер очищается после каждого куска"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    count = 0
+    async for row in _iterate(rows):
+        writer.writerow([_csv_value(row.get(field)) for field in fields])
+        count += 1
+        if count >= EXPORT_CHUNK_ROWS:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+            count = 0
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes], level: int = 6) -> AsyncIterator[bytes]:
+    """Сжимает поток по мере генерации, не накапливая весь ответ"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def streaming_export(request: Request, rows: Rows, fields: List[str], fmt: str, filename: str) -> StreamingResponse:
+    """Потоковая выгрузка строк в NDJSON или CSV (с gzip, если клиент его принимает)"""
+    if fmt not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Поддерживаются форматы ndjson и csv")
+
+    chunks = ndjson_chunks(rows) if fmt == "ndjson" else csv_chunks(rows, fields)
+    headers = {"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'}
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        chunks = gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+
+    return StreamingResponse(chunks, media_type=EXPORT_MEDIA_TYPES[fmt], headers=headers)
@@ -0,0 +1,48 @@
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен: без него используется стандартный json
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    """Компактный JSON в UTF-8, как у JSONResponse, но через orjson, если он есть"""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class RawJSON:
+    """Уже сериализованный фрагмент, который вставляется в ответ без повторного кодирования"""
+
+    __slots__ = ("data",)
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    @classmethod
+    def of(cls, content: Any) -> "RawJSON":
+        return cls(dumps(content))
+
+
+def render(content: Any) -> bytes:
+    """Сериализует ответ; значения RawJSON верхнего уровня вставляются как есть"""
+    if isinstance(content, RawJSON):
+        return content.data
+    if isinstance(content, dict) and any(isinstance(value, RawJSON) for value in content.values()):
+        return b"{" + b",".join(
+            dumps(key) + b":" + (value.data if isinstance(value, RawJSON) else dumps(value))
+            for key, value in content.items()
+        ) + b"}"
+    return dumps(content)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse с orjson и поддержкой готовых фрагментов RawJSON"""
+
+    def render(self, content: Any) -> bytes:
+        return render(content)
@@ -0,0 +1,120 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+# Стоимость bcrypt: при изменении старые хеши пересчитываются при следующем входе
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+
+# Настройки пула хеширования
+HASH_WORKERS = int(os.environ.get("HASH_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+HASH_MAX_QUEUE = int(os.environ.get("HASH_MAX_QUEUE", "0")) or HASH_WORKERS * 8
+HASH_RETRY_AFTER = int(os.environ.get("HASH_RETRY_AFTER", "1"))
+
+_pwd_context = None
+
+
+def get_pwd_context():
+    """Контекст passlib; passlib и bcrypt загружаются только при первом хешировании"""
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+    return _pwd_context
+
+
+def __getattr__(name):
+    # hashing.pwd_context по-прежнему доступен как атрибут
+    if name == "pwd_context":
+        return get_pwd_context()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class HasherBusy(Exception):
+    """Очередь хеширования заполнена, запрос нужно повторить позже"""
+
+
+class PasswordHasher:
+    """Пул потоков для bcrypt с ограниченной очередью.
+
+    bcrypt отпускает GIL, поэтому потоки считают хеши параллельно, а event loop
+    остается свободным. Если в работе и в очереди уже max_queue операций,
+    новая сразу отклоняется исключением HasherBusy вместо ожидания в хвосте.
+    """
+
+    def __init__(self, workers: int = HASH_WORKERS, max_queue: int = HASH_MAX_QUEUE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self._pending = 0
+        self._running = 0
+        self._busy_seconds = 0.0
+        self._started_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._pool
+
+    def _timed(self, func, *args):
+        with self._lock:
+            self._running += 1
+        started = time.monotonic()
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._busy_seconds += time.monotonic() - started
+
+    async def _submit(self, func, *args):
+        if self._pending >= self.max_queue:
+            self.rejected += 1
+            raise HasherBusy()
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_pool(), self._timed, func, *args)
+        finally:
+            self._pending -= 1
+            self.completed += 1
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(get_pwd_context().hash, password)
+
+    async def verify_and_update(self, password: str, hashed_password: Optional[str]) -> Tuple[bool, Optional[str]]:
+        """Проверяет пароль; если хеш создан с другой стоимостью, возвращает новый"""
+        if not hashed_password:
+            return False, None
+        valid, new_hash = await self._submit(get_pwd_context().verify_and_update, password, hashed_password)
+        if new_hash:
+            self.rehashed += 1
+        return valid, new_hash
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self):
+        elapsed = time.monotonic() - self._started_at
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "rounds": BCRYPT_ROUNDS,
+            "in_flight": self._pending,
+            "running": self._running,
+            "queued": max(self._pending - self._running, 0),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "rehashed": self.rehashed,
+            # Доля времени, которую потоки пула были заняты с момента запуска
+            "utilization": round(self._busy_seconds / (elapsed * self.workers), 4) if elapsed else 0.0,
+        }
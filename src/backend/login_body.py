@@ -0,0 +1,112 @@
+import json
+import os
+from typing import Dict, Optional
+from urllib.parse import parse_qsl
+
+from fastapi import Request
+
+# Форма входа - несколько коротких полей, больше читать незачем
+LOGIN_MAX_BODY_BYTES = int(os.environ.get("LOGIN_MAX_BODY_BYTES", str(16 * 1024)))
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+async def read_body(request: Request, limit: int = LOGIN_MAX_BODY_BYTES) -> bytes:
+    """Читает тело запроса, прерываясь, как только оно превысило limit"""
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > limit:
+        raise BodyTooLarge()
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit:
+            raise BodyTooLarge()
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def content_type(request: Request) -> str:
+    """Content-Type прямо из ASGI scope, без построения объекта Headers"""
+    for name, value in request.scope["headers"]:
+        if name == b"content-type":
+            return value.decode("latin-1")
+    return ""
+
+
+def _media_type(content_type: str):
+    media_type, _, params = content_type.partition(";")
+    if not params:
+        return media_type.strip().lower(), {}
+    options = {}
+    for param in params.split(";"):
+        key, sep, value = param.strip().partition("=")
+        if sep:
+            options[key.lower()] = value.strip().strip('"')
+    return media_type.strip().lower(), options
+
+
+def _parse_json(body: bytes) -> Optional[Dict]:
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _parse_urlencoded(text: str) -> Dict:
+    return dict(parse_qsl(text, keep_blank_values=True))
+
+
+def _parse_multipart(body: bytes, boundary: str) -> Optional[Dict]:
+    """Текстовые поля multipart/form-data; файлы в форме входа не нужны и пропускаются"""
+    if not boundary:
+        return None
+    data = {}
+    for part in body.split(b"--" + boundary.encode("latin-1")):
+        head, sep, value = part.partition(b"\r\n\r\n")
+        if not sep:
+            continue
+        name = None
+        for line in head.decode("latin-1").split("\r\n"):
+            if line.lower().startswith("content-disposition:"):
+                _, options = _media_type(line.split(":", 1)[1])
+                if "filename" in options:
+                    name = None
+                    break
+                name = options.get("name")
+        if name is not None:
+            if value.endswith(b"\r\n"):
+                value = value[:-2]
+            data[name] = value.decode("utf-8", errors="replace")
+    return data
+
+
+def parse_login_body(content_type: str, body: bytes) -> Optional[Dict]:
+    """Разбирает тело один раз по Content-Type.
+
+    Без Content-Type (или с неподходящим) формат определяется по первому
+    символу: так клиенты, отправляющие JSON как text/plain, продолжают работать.
+    Возвращает None, если тело не удалось разобрать.
+    """
+    media_type, options = _media_type(content_type or "")
+    if media_type == "multipart/form-data":
+        return _parse_multipart(body, options.get("boundary", ""))
+    if media_type == "application/json" or media_type.endswith("+json"):
+        return _parse_json(body)
+
+    try:
+        text = body.decode(options.get("charset", "utf-8"))
+    except (UnicodeDecodeError, LookupError):
+        return None
+    if media_type == "application/x-www-form-urlencoded":
+        return _parse_urlencoded(text)
+
+    stripped = text.lstrip()
+    if stripped.startswith("{"):
+        return _parse_json(body)
+    if "=" in stripped:
+        return _parse_urlencoded(stripped)
+    return None
@@ -1,13 +1,33 @@
 from fastapi import FastAPI, Depends, HTTPException, status, Header, Request
-from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.responses import JSONResponse
-from fastapi.middleware.gzip import GZipMiddleware
 from pydantic import BaseModel
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from jose import JWTError, jwt
 from typing import Optional, List, Dict, Any
-from fastapi.responses import Response
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from contextlib import asynccontextmanager
+import uuid
+from auth_cache import PrincipalCache
+from cors import CORSMiddleware
+from metrics import MetricsMiddleware
+import profiler
+from profiler import SamplingProfiler, ProfilerMiddleware
+from compression import CompressionMiddleware, CompressedCache
+from fast_json import FastJSONResponse, RawJSON
+from export import streaming_export
+import qr_render
+import qr_jobs
+import models
+from database import AsyncSessionLocal, get_async_engine
+import migrate
+import qr_routes
+from repository import SQLUserRepository, SQLQRCodeRepository
+from hashing import PasswordHasher, HasherBusy, HASH_RETRY_AFTER
+from visits import VisitCounter
+from login_body import read_body, parse_login_body, content_type, BodyTooLarge
+from rate_limit import LoginRateLimiter, RateLimitMiddleware, retry_after_header
+from analytics import ScanAnalytics, ANALYTICS_TREND_DAYS, GRANULARITY_STEPS
 
 # Конфигурация JWT
 SECRET_KEY = "socialqr_secret_key_replace_in_production"
@@ -59,20 +79,32 @@ class QRCode(BaseModel):
     created_at: str
     visits: int
 
-# База данных пользователей
-fake_users_db = {
-    "admin": {
-        "username": "admin",
-        "full_name": "Admin User",
-        "email": "admin@example.com",
-        "hashed_password": "admin",
-        "disabled": False,
-        "is_admin": True,
-    }
+class QRBatchItem(BaseModel):
+    owner: str
+    url: str
+    title: Optional[str] = None
+
+class QRBatchRequest(BaseModel):
+    items: List[QRBatchItem]
+    format: str = "png"
+    size: int = 600
+    ecl: str = "M"
+    margin: int = 4
+
+# Данные, создаваемые при первом запуске, если их еще нет в БД
+DEFAULT_ADMIN = {
+    "username": "admin",
+    "full_name": "Admin User",
+    "email": "admin@example.com",
+    "password": "admin",
+    "is_admin": True,
 }
 
-# База данных QR-кодов
-fake_qr_codes = [
+# Пароль администратора, созданного main.py.fixed (он же в поставляемой socialqr.db).
+# Фронтенд входит как admin/admin, поэтому нетронутый пароль по умолчанию заменяется
+LEGACY_ADMIN_PASSWORD = "admin123"
+
+DEFAULT_QR_CODES = [
     {
         "id": "qr1",
         "owner": "admin",
@@ -91,42 +123,122 @@ fake_qr_codes = [
     }
 ]
 
-app = FastAPI(title="SocialQR API")
+async def seed_defaults():
+    """Создает администратора и тестовые QR-коды в пустой БД; заменяет нетронутый LEGACY_ADMIN_PASSWORD"""
+    existing = await users_repo.get(DEFAULT_ADMIN["username"], fresh=True)
+    if existing is None:
+        admin = {key: value for key, value in DEFAULT_ADMIN.items() if key != "password"}
+        admin["hashed_password"] = await password_hasher.hash(DEFAULT_ADMIN["password"])
+        await users_repo.add(admin)
+    else:
+        # Измененный пароль администратора не трогаем
+        legacy, _ = await password_hasher.verify_and_update(LEGACY_ADMIN_PASSWORD, existing["hashed_password"])
+        if legacy:
+            await users_repo.set_password(DEFAULT_ADMIN["username"], await password_hasher.hash(DEFAULT_ADMIN["password"]))
+            principal_cache.invalidate_user(DEFAULT_ADMIN["username"])
+    missing = [qr for qr in DEFAULT_QR_CODES if await qrcodes_repo.get(qr["id"], fresh=True) is None]
+    if missing:
+        await qrcodes_repo.add_many(missing)
+        # Переносим начальные значения посещений в счетчик
+        await visit_counter.refresh(qr["id"] for qr in missing)
+        for qr in missing:
+            if not visit_counter.has_stored(qr["id"]):
+                visit_counter.record(qr["id"], qr["visits"])
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Схему можно создавать отдельным шагом при деплое (python migrate.py)
+    if migrate.DB_AUTO_MIGRATE:
+        migrate.run()
+    await visit_counter.start()
+    await scan_analytics.start()
+    await seed_defaults()
+    yield
+    # Останавливаем фоновые задачи и пул процессов рендеринга
+    await qr_jobs_registry.cancel_all()
+    qr_jobs.shutdown()
+    password_hasher.shutdown()
+    # Записываем накопленные посещения перед выходом
+    await visit_counter.stop()
+    await scan_analytics.stop()
+
+app = FastAPI(title="SocialQR API", lifespan=lifespan, default_response_class=FastJSONResponse)
+
+# Каждое следующее middleware оборачивает подключенные до него, снаружи внутрь:
+# метрики, CORS, профилировщик, ограничение попыток входа, сжатие
+
+# Сжатие ответов: gzip/br/zstd по Accept-Encoding, сжатые варианты ответов с ETag кешируются
+compressed_cache = CompressedCache()
+app.add_middleware(CompressionMiddleware, cache=compressed_cache)
+
+# Ограничение попыток входа: по IP - до чтения тела запроса, по имени - в universal_login
+LOGIN_PATHS = ["/api/auth/login", "/api/login", "/auth/login", "/login", "/token"]
+login_limiter = LoginRateLimiter()
+app.add_middleware(RateLimitMiddleware, limiter=login_limiter, paths=LOGIN_PATHS)
+
+# Профилировщик включается из админки (/api/admin/profiler/*) или заголовком X-Profile;
+# пока сессий нет, поток сэмплирования не запущен. Он внутри CORS: preflight-запросы,
+# на которые отвечает CORS, не расходуют сессии по запросам и не профилируются
+sampling_profiler = SamplingProfiler()
+app.add_middleware(ProfilerMiddleware, profiler=sampling_profiler)
+
+# CORS снаружи ограничителя: заголовки получают и ответы 429, а preflight
+# отвечается здесь и не доходит до маршрутов.
+# Источники задаются через CORS_ALLOW_ORIGINS
+app.add_middleware(CORSMiddleware)
+
+# Метрики - самый внешний слой: время и размер ответа с учетом сжатия и CORS,
+# /metrics для Prometheus. Preflight-запросы тоже учитываются (OPTIONS, маршрут unmatched)
+app.add_middleware(MetricsMiddleware)
 
-# Улучшенная CORS конфигурация
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "HEAD", "PATCH"],
-    allow_headers=["*"],
-    expose_headers=["*"],
-    max_age=3600,
-)
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
-# Добавляем сжатие ответов для ускорения работы
-app.add_middleware(GZipMiddleware, minimum_size=1000)
+# Кеш проверенных токенов: повторные запросы с тем же токеном
+# не декодируют JWT и не ищут пользователя заново
+principal_cache = PrincipalCache()
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
+# Кеш готовых изображений QR-кодов
+qr_image_cache = qr_render.RenderCache()
+
+# Пакетные задачи генерации QR-кодов для типографий
+qr_jobs_registry = qr_jobs.JobRegistry()
+
+# Пользователи и QR-коды в БД; частые чтения (переходы /q/, токены) идут через кеш
+users_repo = SQLUserRepository(AsyncSessionLocal)
+qrcodes_repo = SQLQRCodeRepository(AsyncSessionLocal)
+
+# Пул для bcrypt: хеширование паролей не блокирует event loop
+password_hasher = PasswordHasher()
+
+# Счетчик сканирований с отложенной пакетной записью в БД
+visit_counter = VisitCounter(get_async_engine)
+
+# Статистика сканирований по минутам, часам и дням для графиков
+scan_analytics = ScanAnalytics(get_async_engine)
+
+def with_visits(qr: dict) -> dict:
+    """QR-код с числом посещений из счетчика (значения обновляются заранее через visit_counter.refresh)"""
+    return {**qr, "visits": visit_counter.count(qr["id"])}
 
 # Функции для работы с JWT и аутентификацией
-def verify_password(plain_password, hashed_password):
-    # В реальном приложении здесь должна быть проверка хеша
-    return plain_password == hashed_password
-
-def get_user(db, username: str):
-    if username in db:
-        user_dict = db[username]
-        return UserInDB(**user_dict)
-    return None
-
-def authenticate_user(fake_db, username: str, password: str):
-    user = get_user(fake_db, username)
-    if not user:
+async def get_user(username: str):
+    record = await users_repo.get(username)
+    if record is None:
+        return None
+    return UserInDB(**record)
+
+async def authenticate_user(username: str, password: str):
+    # Пароль проверяем по свежей записи: в кеше другого воркера может быть старый хеш
+    record = await users_repo.get(username, fresh=True)
+    if not record:
         return False
-    if not verify_password(password, user.hashed_password):
+    valid, new_hash = await password_hasher.verify_and_update(password, record["hashed_password"])
+    if not valid:
         return False
-    return user
+    # Хеш создан с прежней стоимостью bcrypt - сохраняем пересчитанный
+    if new_hash:
+        await users_repo.set_password(username, new_hash)
+    return UserInDB(**record)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -143,14 +255,19 @@ async def get_current_user_optional(token: str = Depends(oauth2_scheme)):
     if token is None:
         return None
     
+    user = principal_cache.get(token)
+    if user is not None:
+        return user
+    
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
             return None
-        user = get_user(fake_users_db, username=username)
+        user = await get_user(username)
         if user is None:
             return None
+        principal_cache.put(token, user, username, payload.get("exp"))
         return user
     except:
         return None
@@ -202,6 +319,21 @@ async def custom_http_exception_handler(request: Request, exc: HTTPException):
         content={"error": True, "message": exc.detail}
     )
 
+# Очередь хеширования паролей переполнена
+@app.exception_handler(HasherBusy)
+async def hasher_busy_handler(request: Request, exc: HasherBusy):
+    return hasher_busy_response()
+
+def hasher_busy_response():
+    return JSONResponse(
+        status_code=503,
+        content={
+            "error": True,
+            "message": "Сервер перегружен, попробуйте позже"
+        },
+        headers={"Retry-After": str(HASH_RETRY_AFTER)}
+    )
+
 # Гибкий эндпоинт для авторизации, принимает данные в любом формате
 @app.post("/api/auth/login")
 @app.post("/api/login")
@@ -209,44 +341,43 @@ async def custom_http_exception_handler(request: Request, exc: HTTPException):
 async def universal_login(request: Request):
     """Универсальный эндпоинт для авторизации, поддерживающий любой формат запроса"""
     try:
-        # Пробуем получить данные из разных источников
-        body = await request.body()
-        try:
-            # Пробуем JSON
-            data = await request.json()
-        except:
-            try:
-                # Пробуем form data
-                data = await request.form()
-                data = dict(data)
-            except:
-                try:
-                    # Пробуем декодировать как строку
-                    body_str = body.decode('utf-8')
-                    if '&' in body_str:
-                        # URL-encoded form data
-                        pairs = body_str.split('&')
-                        data = {}
-                        for pair in pairs:
-                            if '=' in pair:
-                                key, value = pair.split('=', 1)
-                                data[key] = value
-                    else:
-                        # Просто используем логин/пароль по умолчанию
-                        data = {"username": "admin", "password": "admin"}
-                except:
-                    # Если ничего не сработало, пробуем данные по умолчанию
-                    data = {"username": "admin", "password": "admin"}
+        body = await read_body(request)
+    except BodyTooLarge:
+        return JSONResponse(
+            status_code=413,
+            content={
+                "error": True,
+                "message": "Слишком большой запрос"
+            }
+        )
+    
+    try:
+        # Тело разбирается один раз: JSON, urlencoded или multipart по Content-Type
+        data = parse_login_body(content_type(request), body)
+        if data is None:
+            # Просто используем логин/пароль по умолчанию
+            data = {"username": "admin", "password": "admin"}
         
         # Получаем логин и пароль из полученных данных
         username = data.get("username", data.get("login", data.get("email", "")))
         password = data.get("password", data.get("pass", data.get("pwd", "")))
         
+        retry_after = await login_limiter.check_username(str(username))
+        if retry_after:
+            return JSONResponse(
+                status_code=429,
+                content={
+                    "error": True,
+                    "message": "Слишком много попыток входа, попробуйте позже"
+                },
+                headers={"Retry-After": retry_after_header(retry_after)}
+            )
+        
         # Аутентифицируем пользователя
-        user = authenticate_user(fake_users_db, username, password)
+        user = await authenticate_user(username, password)
         if not user:
             # Если не можем аутентифицировать, попробуем admin/admin
-            user = authenticate_user(fake_users_db, "admin", "admin")
+            user = await authenticate_user("admin", "admin")
             if not user:
                 return JSONResponse(
                     status_code=200,
@@ -258,7 +389,7 @@ async def universal_login(request: Request):
         
         # Создаем токен
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
+        access_token = create_access_token(
             data={"sub": user.username}, expires_delta=access_token_expires
         )
         
@@ -272,16 +403,18 @@ async def universal_login(request: Request):
                 "access_token": access_token,
                 "token_type": "bearer",
                 "user": {
-                "username": user.username,
+                    "username": user.username,
                     "email": user.email,
                     "full_name": user.full_name,
                     "is_admin": user.is_admin
                 }
             }
         )
+    except HasherBusy:
+        return hasher_busy_response()
     except Exception as e:
         # В случае ошибки просто пытаемся авторизовать как admin
-        user = authenticate_user(fake_users_db, "admin", "admin")
+        user = await authenticate_user("admin", "admin")
         if user:
             access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
             access_token = create_access_token(
@@ -314,33 +447,44 @@ async def universal_login(request: Request):
             }
         )
 
+# Навигация не меняется, поэтому сериализуется один раз при запуске
+# и вставляется в ответы готовыми байтами
+_BASE_NAV_ITEMS = [
+    {"id": "profile", "title": "Страница памяти", "url": "/profile", "icon": "user", "order": 1},
+    {"id": "qrcodes", "title": "Мои QR-коды", "url": "/my-qrcodes", "icon": "qrcode", "order": 2}
+]
+USER_NAVIGATION = RawJSON.of({"items": _BASE_NAV_ITEMS})
+ADMIN_NAVIGATION = RawJSON.of({
+    "items": _BASE_NAV_ITEMS + [{"id": "admin", "title": "Админ панель", "url": "/admin", "icon": "shield", "order": 3}]
+})
+ANONYMOUS_STATUS = RawJSON.of({
+    "authenticated": False,
+    "user": None,
+    "navigation": {
+        "items": [
+            {"id": "login", "title": "Вход", "url": "/login", "icon": "login", "order": 1},
+            {"id": "about", "title": "О сервисе", "url": "/about", "icon": "info", "order": 2}
+        ]
+    }
+})
+ADMIN_SECTIONS = RawJSON.of({
+    "error": False,
+    "sections": [
+        {"id": "dashboard", "title": "Информационная панель", "url": "/admin", "icon": "dashboard"},
+        {"id": "users", "title": "Пользователи", "url": "/admin/users", "icon": "users"},
+        {"id": "qrcodes", "title": "QR-коды", "url": "/admin/qrcodes", "icon": "qrcode"},
+        {"id": "settings", "title": "Настройки", "url": "/admin/settings", "icon": "settings"}
+    ]
+})
+
 # Проверка авторизации - стабильный эндпоинт
 @app.get("/api/auth/status")
 async def auth_status(user: User = Depends(get_current_user_optional)):
     """Проверка статуса авторизации и получение данных пользователя"""
     if user is None:
-        return {
-            "authenticated": False,
-            "user": None,
-            "navigation": {
-                "items": [
-                    {"id": "login", "title": "Вход", "url": "/login", "icon": "login", "order": 1},
-                    {"id": "about", "title": "О сервисе", "url": "/about", "icon": "info", "order": 2}
-                ]
-            }
-        }
+        return FastJSONResponse(ANONYMOUS_STATUS)
     
-    # Базовая навигация для всех пользователей
-    nav_items = [
-        {"id": "profile", "title": "Страница памяти", "url": "/profile", "icon": "user", "order": 1},
-        {"id": "qrcodes", "title": "Мои QR-коды", "url": "/my-qrcodes", "icon": "qrcode", "order": 2}
-    ]
-    
-    # Добавляем админ-панель для админов
-    if user.is_admin:
-        nav_items.append({"id": "admin", "title": "Админ панель", "url": "/admin", "icon": "shield", "order": 3})
-    
-    return {
+    return FastJSONResponse({
         "authenticated": True,
         "user": {
             "username": user.username,
@@ -348,10 +492,8 @@ async def auth_status(user: User = Depends(get_current_user_optional)):
             "full_name": user.full_name,
             "is_admin": user.is_admin
         },
-        "navigation": {
-            "items": nav_items
-        }
-    }
+        "navigation": ADMIN_NAVIGATION if user.is_admin else USER_NAVIGATION
+    })
 
 # Эндпоинты для профиля пользователя
 @app.get("/api/user/profile")
@@ -373,46 +515,42 @@ async def user_change_password(data: PasswordChange, user: User = Depends(get_cu
     if user.username != data.username:
         return {"error": True, "message": "Вы можете изменить только свой пароль"}
     
-    if not verify_password(data.current_password, fake_users_db[user.username]["hashed_password"]):
+    if not await authenticate_user(user.username, data.current_password or ""):
         return {"error": True, "message": "Неверный текущий пароль"}
     
-    fake_users_db[user.username]["hashed_password"] = data.new_password
+    await users_repo.set_password(user.username, await password_hasher.hash(data.new_password))
+    principal_cache.invalidate_user(user.username)
     return {"error": False, "message": "Пароль успешно изменен"}
 
 # Эндпоинты администратора
 @app.get("/api/admin/dashboard")
 async def admin_dashboard(user: User = Depends(get_admin_user)):
     """Панель управления администратора"""
+    now = datetime.utcnow()
+    trend = await scan_analytics.series(now - timedelta(days=ANALYTICS_TREND_DAYS), now, granularity="d")
+    await visit_counter.refresh()
     return {
         "error": False,
         "stats": {
-            "users_count": len(fake_users_db),
-            "qrcodes_count": len(fake_qr_codes),
-            "total_visits": sum(qr.get("visits", 0) for qr in fake_qr_codes)
-        }
+            "users_count": await users_repo.count(),
+            "qrcodes_count": await qrcodes_repo.count(),
+            "total_visits": visit_counter.total
+        },
+        "trend": trend
     }
 
 @app.get("/api/admin/navigation")
 async def admin_navigation(user: User = Depends(get_admin_user)):
     """Структура навигации админ-панели"""
-    return {
-        "error": False,
-        "sections": [
-            {"id": "dashboard", "title": "Информационная панель", "url": "/admin", "icon": "dashboard"},
-            {"id": "users", "title": "Пользователи", "url": "/admin/users", "icon": "users"},
-            {"id": "qrcodes", "title": "QR-коды", "url": "/admin/qrcodes", "icon": "qrcode"},
-            {"id": "settings", "title": "Настройки", "url": "/admin/settings", "icon": "settings"}
-        ]
-    }
+    return FastJSONResponse(ADMIN_SECTIONS)
 
 @app.get("/api/admin/users")
 async def admin_users(user: User = Depends(get_admin_user)):
     """Список пользователей для администратора"""
     users_list = []
-    for username, user_data in fake_users_db.items():
-        user_copy = user_data.copy()
-        user_copy.pop("hashed_password", None)  # Не возвращаем пароль
-        users_list.append(user_copy)
+    async for user_data in users_repo.iter_all():
+        user_data.pop("hashed_password", None)  # Не возвращаем пароль
+        users_list.append(user_data)
     
     return {
         "error": False,
@@ -422,20 +560,238 @@ async def admin_users(user: User = Depends(get_admin_user)):
 @app.post("/api/admin/change-password")
 async def admin_change_password(data: PasswordChange, user: User = Depends(get_admin_user)):
     """Изменение пароля администратором"""
-    if data.username not in fake_users_db:
+    if await users_repo.get(data.username, fresh=True) is None:
         return {"error": True, "message": f"Пользователь {data.username} не найден"}
     
-    fake_users_db[data.username]["hashed_password"] = data.new_password
+    await users_repo.set_password(data.username, await password_hasher.hash(data.new_password))
+    principal_cache.invalidate_user(data.username)
     return {"error": False, "message": f"Пароль пользователя {data.username} успешно изменен"}
 
+@app.get("/api/admin/auth-cache")
+async def admin_auth_cache(user: User = Depends(get_admin_user)):
+    """Статистика кеша проверенных токенов"""
+    return {
+        "error": False,
+        "stats": principal_cache.stats()
+    }
+
 @app.get("/api/admin/qrcodes")
-async def admin_qrcodes(user: User = Depends(get_admin_user)):
-    """Список всех QR-кодов для администратора"""
+async def admin_qrcodes(owner: Optional[str] = None, user: User = Depends(get_admin_user)):
+    """Список QR-кодов для администратора (все или одного владельца)"""
+    qrcodes = await qrcodes_repo.list(owner)
+    await visit_counter.refresh(qr["id"] for qr in qrcodes)
+    return {
+        "error": False,
+        "qrcodes": [with_visits(qr) for qr in qrcodes]
+    }
+
+# Потоковая выгрузка для ежемесячной сверки (format=ndjson или csv)
+USER_EXPORT_FIELDS = ["username", "email", "full_name", "disabled", "is_admin"]
+QRCODE_EXPORT_FIELDS = ["id", "owner", "url", "title", "created_at", "visits"]
+
+async def export_user_rows():
+    async for user_data in users_repo.iter_all():
+        yield {field: user_data.get(field) for field in USER_EXPORT_FIELDS}
+
+async def export_qrcode_rows():
+    await visit_counter.refresh(None)
+    async for qr in qrcodes_repo.iter_all():
+        yield with_visits(qr)
+
+@app.get("/api/admin/export/users")
+async def admin_export_users(request: Request, format: str = "ndjson", user: User = Depends(get_admin_user)):
+    """Выгрузка всех пользователей"""
+    return streaming_export(request, export_user_rows(), USER_EXPORT_FIELDS, format, "users")
+
+@app.get("/api/admin/export/qrcodes")
+async def admin_export_qrcodes(request: Request, format: str = "ndjson", user: User = Depends(get_admin_user)):
+    """Выгрузка всех QR-кодов"""
+    return streaming_export(request, export_qrcode_rows(), QRCODE_EXPORT_FIELDS, format, "qrcodes")
+
+# Изображения QR-кодов для типографий и писем
+@app.get("/api/qrcodes/{qr_id}/image")
+async def qrcode_image(qr_id: str, request: Request, format: str = "png", size: int = 300, ecl: str = "M", margin: int = 4):
+    """Изображение QR-кода по его id"""
+    qr = await qrcodes_repo.get(qr_id)
+    if qr is None:
+        raise HTTPException(status_code=404, detail="QR-код не найден")
+    return await qr_routes.qr_image_response(qr_image_cache, request, qr["url"], format, size, ecl, margin, "public, max-age=3600")
+
+app.include_router(qr_routes.render_router(qr_image_cache))
+
+@app.post("/api/admin/qrcodes/batch", status_code=202)
+async def admin_qrcodes_batch(data: QRBatchRequest, user: User = Depends(get_admin_user)):
+    """Создает QR-коды пачкой и запускает фоновый рендеринг изображений"""
+    ecl = data.ecl.upper()
+    if data.format not in qr_render.QR_MEDIA_TYPES or ecl not in qr_render.ERROR_CORRECTION_LEVELS:
+        raise HTTPException(status_code=400, detail="Недопустимый формат или уровень коррекции")
+    if not 32 <= data.size <= qr_render.QR_MAX_IMAGE_SIZE or not 0 <= data.margin <= qr_render.QR_MAX_MARGIN:
+        raise HTTPException(status_code=400, detail="Недопустимый размер или отступ")
+    if not data.items or len(data.items) > qr_jobs.QR_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"В пакете должно быть от 1 до {qr_jobs.QR_BATCH_MAX_ITEMS} QR-кодов")
+    
+    created_at = datetime.utcnow().strftime("%Y-%m-%d")
+    records = [
+        {
+            "id": "qr" + uuid.uuid4().hex[:12],
+            "owner": item.owner,
+            "url": item.url,
+            "title": item.title or item.url,
+            "created_at": created_at,
+            "visits": 0
+        }
+        for item in data.items
+    ]
+    # Все записи добавляются одной транзакцией: либо весь пакет, либо ничего
+    await qrcodes_repo.add_many(records)
+    
+    job = await qr_jobs_registry.start(qr_jobs.QRBatchJob(records, data.format, data.size, ecl, data.margin))
+    return {
+        "error": False,
+        "job": job.to_dict(),
+        "status_url": f"/api/admin/qrcodes/batch/{job.id}",
+        "download_url": f"/api/admin/qrcodes/batch/{job.id}/download"
+    }
+
+@app.get("/api/admin/qrcodes/batch/{job_id}")
+async def admin_qrcodes_batch_status(job_id: str, user: User = Depends(get_admin_user)):
+    """Состояние пакетной задачи"""
+    job = await qr_jobs_registry.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return {"error": False, "job": job.to_dict()}
+
+@app.get("/api/admin/qrcodes/batch/{job_id}/download")
+async def admin_qrcodes_batch_download(job_id: str, user: User = Depends(get_admin_user)):
+    """ZIP-архив изображений; отдается по мере готовности, не дожидаясь конца задачи"""
+    job = await qr_jobs_registry.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return StreamingResponse(
+        qr_jobs.zip_stream(job),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="qrcodes-{job.id}.zip"'}
+    )
+
+# Переход по QR-коду: считаем посещение и перенаправляем на страницу
+app.include_router(qr_routes.scan_router(qrcodes_repo, visit_counter, scan_analytics))
+
+def analytics_range(start: Optional[datetime], end: Optional[datetime], granularity: Optional[str]):
+    """Интервал графика: по умолчанию последние 30 дней"""
+    if granularity is not None and granularity not in GRANULARITY_STEPS:
+        raise HTTPException(status_code=400, detail="Шаг графика: m, h или d")
+    end = end or datetime.utcnow()
+    start = start or end - timedelta(days=ANALYTICS_TREND_DAYS)
+    # Часовой пояс клиента отбрасываем: корзины хранятся в UTC
+    if end.tzinfo is not None:
+        end = end.astimezone(timezone.utc).replace(tzinfo=None)
+    if start.tzinfo is not None:
+        start = start.astimezone(timezone.utc).replace(tzinfo=None)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="Начало интервала должно быть раньше конца")
+    return start, end
+
+@app.get("/api/qrcodes/{qr_id}/stats")
+async def qr_stats(qr_id: str, start: Optional[datetime] = None, end: Optional[datetime] = None, granularity: Optional[str] = None, user: User = Depends(get_current_user)):
+    """График сканирований QR-кода (владелец или администратор)"""
+    qr = await qrcodes_repo.get(qr_id)
+    if qr is None:
+        raise HTTPException(status_code=404, detail="QR-код не найден")
+    if qr["owner"] != user.username and not user.is_admin:
+        raise HTTPException(status_code=403, detail="Нет доступа к статистике этого QR-кода")
+    start, end = analytics_range(start, end, granularity)
+    return {"error": False, "qr_id": qr_id, "series": await scan_analytics.series(start, end, qr_id, granularity)}
+
+@app.get("/api/admin/analytics")
+async def admin_analytics(start: Optional[datetime] = None, end: Optional[datetime] = None, granularity: Optional[str] = None, user: User = Depends(get_admin_user)):
+    """График сканирований по всей платформе"""
+    start, end = analytics_range(start, end, granularity)
+    return {"error": False, "series": await scan_analytics.series(start, end, None, granularity)}
+
+@app.get("/api/admin/rate-limit")
+async def admin_rate_limit(user: User = Depends(get_admin_user)):
+    """Состояние ограничителя попыток входа"""
     return {
         "error": False,
-        "qrcodes": fake_qr_codes
+        "stats": login_limiter.stats()
     }
 
+@app.get("/api/admin/visits")
+async def admin_visits(user: User = Depends(get_admin_user)):
+    """Состояние счетчика посещений"""
+    return {
+        "error": False,
+        "stats": visit_counter.stats()
+    }
+
+@app.get("/api/admin/repository")
+async def admin_repository(user: User = Depends(get_admin_user)):
+    """Статистика кешей чтения пользователей и QR-кодов"""
+    return {
+        "error": False,
+        "stats": {
+            "users": users_repo.cache.stats(),
+            "qrcodes": qrcodes_repo.cache.stats()
+        }
+    }
+
+@app.get("/api/admin/compression")
+async def admin_compression(user: User = Depends(get_admin_user)):
+    """Статистика кеша сжатых ответов"""
+    return {
+        "error": False,
+        "stats": compressed_cache.stats()
+    }
+
+@app.get("/api/admin/qr-cache")
+async def admin_qr_cache(user: User = Depends(get_admin_user)):
+    """Статистика кеша изображений QR-кодов"""
+    return {
+        "error": False,
+        "stats": qr_image_cache.stats()
+    }
+
+def profile_response(session: profiler.ProfileSession) -> PlainTextResponse:
+    """Стеки в формате collapsed: flamegraph.pl, speedscope, inferno"""
+    return PlainTextResponse(
+        session.collapsed(),
+        headers={"X-Profile-Id": session.id, "X-Profile-Samples": str(session.samples)}
+    )
+
+def check_profile_seconds(seconds: float):
+    if not 0 < seconds <= profiler.PROFILER_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"Длительность профилирования: от 0 до {profiler.PROFILER_MAX_SECONDS:g} с")
+
+@app.get("/api/admin/profiler")
+async def admin_profiler(user: User = Depends(get_admin_user)):
+    """Состояние профилировщика этого процесса"""
+    return {
+        "error": False,
+        "stats": sampling_profiler.stats()
+    }
+
+@app.post("/api/admin/profiler/sample")
+async def admin_profiler_sample(seconds: float = 10, include_idle: bool = False, user: User = Depends(get_admin_user)):
+    """Сэмплирует все потоки процесса seconds секунд"""
+    check_profile_seconds(seconds)
+    return profile_response(await sampling_profiler.profile_for(seconds, include_idle))
+
+@app.post("/api/admin/profiler/requests")
+async def admin_profiler_requests(route: str, count: int = 10, timeout: float = 30, user: User = Depends(get_admin_user)):
+    """Сэмплирует, пока обрабатываются следующие count запросов с путем по шаблону route"""
+    check_profile_seconds(timeout)
+    if count < 1:
+        raise HTTPException(status_code=400, detail="Число запросов должно быть положительным")
+    return profile_response(await sampling_profiler.profile_requests(route, count, timeout))
+
+@app.get("/api/admin/profiler/results/{profile_id}")
+async def admin_profiler_result(profile_id: str, user: User = Depends(get_admin_user)):
+    """Профиль запроса, отправленного с заголовком X-Profile"""
+    result = profiler.load_result(profile_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Профиль не найден")
+    return PlainTextResponse(result)
+
 # Эндпоинт /users/me, который пытается использовать фронтенд
 @app.get("/users/me")
 async def get_user_me(request: Request):
@@ -456,11 +812,10 @@ async def get_user_me(request: Request):
     token = auth_header.replace("Bearer ", "")
     
     try:
-        # Проверяем токен
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
+        # Проверяем токен (через кеш проверенных токенов)
+        user = await get_current_user_optional(token)
         
-        if not username or username not in fake_users_db:
+        if user is None:
             # Если токен недействительный, возвращаем дефолтного админа
             return JSONResponse(
                 status_code=200,
@@ -472,17 +827,14 @@ async def get_user_me(request: Request):
                 }
             )
         
-        # Получаем данные пользователя
-        user_data = fake_users_db[username]
-        
         # Возвращаем информацию о пользователе
         return JSONResponse(
             status_code=200,
             content={
                 "id": 1,
-                "username": user_data["username"],
-                "name": user_data["full_name"],
-                "is_admin": user_data.get("is_admin", False)
+                "username": user.username,
+                "name": user.full_name,
+                "is_admin": user.is_admin or False
             }
         )
     except:
@@ -502,28 +854,6 @@ async def get_user_me(request: Request):
 def root():
     return {"message": "SocialQR API работает!"}
 
-# Функция для обработки CORS-заголовков в ответах
-@app.middleware("http")
-async def add_cors_headers(request: Request, call_next):
-    response = await call_next(request)
-    response.headers["Access-Control-Allow-Origin"] = "*"
-    response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS, HEAD, PATCH"
-    response.headers["Access-Control-Allow-Headers"] = "*"
-    response.headers["Access-Control-Allow-Credentials"] = "true"
-    response.headers["Access-Control-Max-Age"] = "3600"
-    return response
-
-# Специальный обработчик для всех OPTIONS запросов
-@app.options("/{path:path}")
-async def options_route(path: str, response: Response):
-    """Обрабатывает preflight запросы для всех маршрутов"""
-    response.headers["Access-Control-Allow-Origin"] = "*"
-    response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS, HEAD, PATCH"
-    response.headers["Access-Control-Allow-Headers"] = "*"
-    response.headers["Access-Control-Allow-Credentials"] = "true"
-    response.headers["Access-Control-Max-Age"] = "3600"
-    return {}
-
 # Дублируем основные эндпоинты для максимальной совместимости
 @app.post("/login")
 @app.post("/token")
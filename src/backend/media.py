@@ -0,0 +1,572 @@
+"""Хранилище медиафайлов виджетов с адресацией по содержимому.
+
+Файл хранится под своим SHA-256: MEDIA_DIR/ab/cd/<hash>, поэтому одинаковые
+картинки хранятся один раз, а ответ по /media/<hash> никогда не меняется
+и кешируется навсегда (ETag - сам хеш). Загрузка принимается потоком:
+тело multipart/form-data (поле с файлом) или само изображение пишется
+во временный файл по частям, считая хеш, и переименовывается в итоговый.
+
+Уменьшенные копии (MEDIA_THUMBNAIL_WIDTHS) строятся в пуле процессов через
+Pillow после загрузки или при первом запросе ?w=<ширина>; пока копии нет,
+отдается оригинал без долгого кеширования. Без Pillow всегда отдается оригинал.
+
+Виджеты ссылаются на файлы по URL с хешем: встроенные картинки (data: URL)
+из контента переносятся в хранилище при сохранении виджета, для уже
+сохраненных виджетов - командой
+    python media.py externalize
+
+Файлы, на которые больше не ссылается ни один виджет, не удаляются.
+"""
+import asyncio
+import base64
+import binascii
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, List, Optional, Set, Tuple
+
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+
+from profile_cache import etag_matches
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart до 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow необязателен: без него уменьшенные копии не строятся
+    Image = None
+
+MEDIA_DIR = os.environ.get("MEDIA_DIR", "./media")
+# Начало URL файлов в контенте виджетов; для фронтенда на другом домене - полный адрес API
+MEDIA_URL_PREFIX = os.environ.get("MEDIA_URL_PREFIX", "/media").rstrip("/")
+MEDIA_MAX_UPLOAD_BYTES = int(os.environ.get("MEDIA_MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+MEDIA_THUMBNAIL_WIDTHS = tuple(int(width) for width in os.environ.get("MEDIA_THUMBNAIL_WIDTHS", "160,480,1024").split(",") if width.strip())
+MEDIA_THUMBNAIL_WORKERS = int(os.environ.get("MEDIA_THUMBNAIL_WORKERS", "2"))
+# data: URL длиннее этого числа символов выносятся из контента в хранилище
+MEDIA_INLINE_MAX_CHARS = int(os.environ.get("MEDIA_INLINE_MAX_CHARS", "2048"))
+# Префикс internal-location nginx: файл отдает nginx через sendfile (X-Accel-Redirect)
+MEDIA_ACCEL_REDIRECT = os.environ.get("MEDIA_ACCEL_REDIRECT", "").rstrip("/")
+MEDIA_CHUNK_SIZE = 256 * 1024
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Сигнатуры поддерживаемых форматов; SVG не принимается: в нем может быть скрипт
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+SNIFF_BYTES = 16
+
+
+class MediaTooLarge(Exception):
+    pass
+
+
+class UnsupportedMedia(Exception):
+    pass
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def sniff(head: bytes) -> Optional[str]:
+    """Тип изображения по первым байтам файла"""
+    for signature, content_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def is_hash(value: str) -> bool:
+    return len(value) == 64 and all(char in "0123456789abcdef" for char in value)
+
+
+def media_url(digest: str) -> str:
+    return f"{MEDIA_URL_PREFIX}/{digest}"
+
+
+class StoredMedia:
+    __slots__ = ("hash", "content_type", "size", "deduplicated")
+
+    def __init__(self, digest: str, content_type: str, size: int, deduplicated: bool):
+        self.hash = digest
+        self.content_type = content_type
+        self.size = size
+        self.deduplicated = deduplicated
+
+    def to_dict(self) -> dict:
+        return {
+            "hash": self.hash,
+            "url": media_url(self.hash),
+            "content_type": self.content_type,
+            "size": self.size,
+            "deduplicated": self.deduplicated,
+            "thumbnails": {str(width): f"{media_url(self.hash)}?w={width}" for width in MEDIA_THUMBNAIL_WIDTHS},
+        }
+
+
+class MediaWriter:
+    """Временный файл загрузки: данные пишутся по частям, хеш и размер считаются на ходу.
+
+    Конструктор, write() и commit() работают с диском и вызываются из пула потоков.
+    В event loop данные добавляются через append() и пишутся в файл пачками
+    по MEDIA_CHUNK_SIZE через flush().
+    """
+
+    def __init__(self, store: "MediaStore", max_bytes: int):
+        os.makedirs(store.tmp_dir, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=store.tmp_dir)
+        self.file = os.fdopen(fd, "wb")
+        self.store = store
+        self.max_bytes = max_bytes
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.head = b""
+        self._buffer: List[bytes] = []
+        self._buffered = 0
+
+    def _add_size(self, length: int):
+        self.size += length
+        if self.size > self.max_bytes:
+            raise MediaTooLarge()
+
+    def _write(self, data: bytes):
+        if len(self.head) < SNIFF_BYTES:
+            self.head += data[:SNIFF_BYTES - len(self.head)]
+        self.digest.update(data)
+        self.file.write(data)
+
+    def write(self, data: bytes):
+        self._add_size(len(data))
+        self._write(data)
+
+    def append(self, data: bytes):
+        """Добавляет данные в буфер без обращения к диску; размер проверяется сразу"""
+        self._add_size(len(data))
+        self._buffer.append(data)
+        self._buffered += len(data)
+
+    async def flush(self, final: bool = False):
+        """Пишет накопленный буфер в пуле потоков; без final - только полную пачку"""
+        if not self._buffer or (self._buffered < MEDIA_CHUNK_SIZE and not final):
+            return
+        data = b"".join(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        await run_in_threadpool(self._write, data)
+
+    def abort(self):
+        self.file.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def commit(self) -> StoredMedia:
+        """Переносит файл в хранилище; если такой файл уже есть, временный удаляется"""
+        self.file.close()
+        content_type = sniff(self.head)
+        if content_type is None or self.size == 0:
+            self.abort()
+            raise UnsupportedMedia()
+        digest = self.digest.hexdigest()
+        path = self.store.original_path(digest)
+        if os.path.exists(path):
+            os.remove(self.path)
+            return StoredMedia(digest, content_type, self.size, True)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(self.path, path)
+        return StoredMedia(digest, content_type, self.size, False)
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """Пул процессов создается при первой уменьшенной копии"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=MEDIA_THUMBNAIL_WORKERS)
+    return _pool
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def make_thumbnails(source: str, targets: List[Tuple[int, str]]) -> int:
+    """Строит уменьшенные копии (выполняется в пуле процессов); возвращает число новых файлов"""
+    created = 0
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        has_alpha = image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+        for width, path in targets:
+            if os.path.exists(path):
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if image.width <= width:
+                # Оригинал не шире копии: вместо копии - жесткая ссылка на него
+                try:
+                    os.link(source, path)
+                except FileExistsError:
+                    pass
+                except OSError:
+                    shutil.copyfile(source, path)
+                continue
+            thumbnail = image.convert("RGBA" if has_alpha else "RGB")
+            thumbnail.thumbnail((width, image.height))
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as output:
+                if has_alpha:
+                    thumbnail.save(output, "PNG", optimize=True)
+                else:
+                    thumbnail.save(output, "JPEG", quality=85, optimize=True, progressive=True)
+            os.replace(tmp_path, path)
+            created += 1
+    return created
+
+
+class MediaStore:
+    def __init__(self, root: str = MEDIA_DIR, max_upload_bytes: int = MEDIA_MAX_UPLOAD_BYTES):
+        self.root = root
+        self.tmp_dir = os.path.join(root, "tmp")
+        self.max_upload_bytes = max_upload_bytes
+        self.uploads = 0
+        self.deduplicated = 0
+        self.thumbnails_created = 0
+        self.thumbnail_errors = 0
+        self._pending: Set[str] = set()
+        self._types: "OrderedDict[str, str]" = OrderedDict()
+        self._types_lock = threading.Lock()
+
+    def original_path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def thumbnail_path(self, digest: str, width: int) -> str:
+        return os.path.join(self.root, "thumbs", str(width), digest[:2], digest)
+
+    def _count(self, stored: StoredMedia) -> StoredMedia:
+        self.uploads += 1
+        if stored.deduplicated:
+            self.deduplicated += 1
+        return stored
+
+    async def receive(self, request) -> StoredMedia:
+        """Принимает загрузку потоком: multipart/form-data (первое поле с файлом) или тело-изображение"""
+        content_type, params = parse_options_header(request.headers.get("content-type", ""))
+        declared = request.headers.get("content-length")
+        if declared and declared.isdigit() and int(declared) > self.max_upload_bytes + 64 * 1024:
+            raise MediaTooLarge()
+
+        writer = await run_in_threadpool(MediaWriter, self, self.max_upload_bytes)
+        try:
+            if content_type == b"multipart/form-data":
+                if b"boundary" not in params:
+                    raise UnsupportedMedia()
+                received = await self._receive_multipart(request, params[b"boundary"], writer)
+            else:
+                received = False
+                async for chunk in request.stream():
+                    if chunk:
+                        writer.append(chunk)
+                        await writer.flush()
+                        received = True
+            if not received:
+                raise UnsupportedMedia()
+            await writer.flush(final=True)
+        except BaseException:
+            writer.abort()
+            raise
+        stored = await run_in_threadpool(writer.commit)
+        self.schedule_thumbnails(stored.hash)
+        return self._count(stored)
+
+    async def _receive_multipart(self, request, boundary: bytes, writer: MediaWriter) -> bool:
+        state = {"headers": {}, "field": b"", "value": b"", "target": None, "received": False}
+
+        def on_header_field(data, start, end):
+            state["field"] += data[start:end]
+
+        def on_header_value(data, start, end):
+            state["value"] += data[start:end]
+
+        def on_header_end():
+            state["headers"][state["field"].lower()] = state["value"]
+            state["field"] = state["value"] = b""
+
+        def on_headers_finished():
+            _, options = parse_options_header(state["headers"].get(b"content-disposition", b""))
+            # Данные пишутся только из первой части с файлом, остальные поля пропускаются
+            if b"filename" in options and not state["received"]:
+                state["target"] = writer
+                state["received"] = True
+
+        def on_part_data(data, start, end):
+            if state["target"] is not None:
+                state["target"].append(data[start:end])
+
+        def on_part_end():
+            state["headers"] = {}
+            state["target"] = None
+
+        parser = MultipartParser(boundary, {
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+        })
+        async for chunk in request.stream():
+            # Парсер только складывает данные файла в буфер писателя
+            parser.write(chunk)
+            await writer.flush()
+        parser.finalize()
+        return state["received"]
+
+    def store_bytes(self, data: bytes) -> StoredMedia:
+        """Сохраняет готовые байты (встроенные картинки); вызывается из пула потоков"""
+        writer = MediaWriter(self, self.max_upload_bytes)
+        try:
+            writer.write(data)
+        except BaseException:
+            writer.abort()
+            raise
+        return self._count(writer.commit())
+
+    def externalize(self, content: Any) -> Tuple[Any, List[str]]:
+        """Заменяет в контенте встроенные картинки (data: URL) ссылками на хранилище.
+        Возвращает новый контент и хеши сохраненных файлов. Вызывается из пула потоков."""
+        hashes: List[str] = []
+
+        def replace(value):
+            if isinstance(value, dict):
+                return {key: replace(item) for key, item in value.items()}
+            if isinstance(value, list):
+                return [replace(item) for item in value]
+            if is_inline_image(value):
+                try:
+                    header, payload = value.split(",", 1)
+                    stored = self.store_bytes(base64.b64decode(payload, validate=True))
+                except (ValueError, binascii.Error, MediaTooLarge, UnsupportedMedia):
+                    return value
+                hashes.append(stored.hash)
+                return media_url(stored.hash)
+            return value
+
+        return replace(content), hashes
+
+    def schedule_thumbnails(self, digest: str):
+        """Запускает построение уменьшенных копий в пуле процессов, если их еще нет"""
+        if Image is None or not MEDIA_THUMBNAIL_WIDTHS or digest in self._pending:
+            return
+        targets = [
+            (width, self.thumbnail_path(digest, width))
+            for width in MEDIA_THUMBNAIL_WIDTHS
+            if not os.path.exists(self.thumbnail_path(digest, width))
+        ]
+        if not targets:
+            return
+        self._pending.add(digest)
+        future = asyncio.get_running_loop().run_in_executor(get_pool(), make_thumbnails, self.original_path(digest), targets)
+
+        def done(future):
+            self._pending.discard(digest)
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                self.thumbnail_errors += 1
+                print(f"Ошибка при построении уменьшенных копий {digest}: {future.exception()}")
+            else:
+                self.thumbnails_created += future.result()
+
+        future.add_done_callback(done)
+
+    def content_type(self, path: str) -> Optional[str]:
+        """Тип файла по сигнатуре; файлы неизменны, поэтому результат кешируется"""
+        with self._types_lock:
+            content_type = self._types.get(path)
+            if content_type is not None:
+                self._types.move_to_end(path)
+                return content_type
+        with open(path, "rb") as file:
+            content_type = sniff(file.read(SNIFF_BYTES))
+        if content_type is not None:
+            with self._types_lock:
+                self._types[path] = content_type
+                if len(self._types) > 10000:
+                    self._types.popitem(last=False)
+        return content_type
+
+    async def response(self, request, digest: str, width: Optional[int] = None) -> Optional[Response]:
+        """Ответ с файлом или уменьшенной копией; None, если файла нет"""
+        path = self.original_path(digest)
+        etag = f'"{digest}"'
+        cache_control = IMMUTABLE_CACHE_CONTROL
+        if width is not None:
+            thumbnail = self.thumbnail_path(digest, width)
+            if os.path.exists(thumbnail):
+                path = thumbnail
+                etag = f'"{digest}-{width}"'
+            else:
+                # Копии еще нет: оригинал отдается без долгого кеширования, копия строится
+                cache_control = "no-cache"
+                etag = f'"{digest}-{width}-original"'
+                if os.path.exists(path):
+                    self.schedule_thumbnails(digest)
+        try:
+            size = os.path.getsize(path)
+            content_type = await run_in_threadpool(self.content_type, path)
+        except FileNotFoundError:
+            return None
+        headers = {"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes"}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+
+        if MEDIA_ACCEL_REDIRECT:
+            # nginx сам обработает Range и отдаст файл через sendfile
+            relative = os.path.relpath(path, self.root).replace(os.sep, "/")
+            headers["X-Accel-Redirect"] = f"{MEDIA_ACCEL_REDIRECT}/{relative}"
+            return Response(headers=headers, media_type=content_type)
+
+        range_header = request.headers.get("range")
+        if_range = request.headers.get("if-range")
+        if range_header and (if_range is None or if_range == etag):
+            try:
+                byte_range = parse_range(range_header, size)
+            except RangeNotSatisfiable:
+                return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+            if byte_range is not None:
+                start, end = byte_range
+                headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+                return FileRangeResponse(path, start, end - start + 1, content_type, headers, status_code=206)
+        return FileRangeResponse(path, 0, size, content_type, headers)
+
+    def stats(self) -> dict:
+        return {
+            "uploads": self.uploads,
+            "deduplicated": self.deduplicated,
+            "thumbnails_created": self.thumbnails_created,
+            "thumbnail_errors": self.thumbnail_errors,
+            "thumbnails_pending": len(self._pending),
+            "thumbnails_enabled": Image is not None,
+        }
+
+
+def is_inline_image(value: Any) -> bool:
+    return isinstance(value, str) and len(value) > MEDIA_INLINE_MAX_CHARS and value.startswith("data:image/") and ";base64," in value[:64]
+
+
+def has_inline_media(content: Any) -> bool:
+    """Есть ли в контенте встроенные картинки; проверка без пула потоков"""
+    if isinstance(content, dict):
+        return any(has_inline_media(value) for value in content.values())
+    if isinstance(content, list):
+        return any(has_inline_media(value) for value in content)
+    return is_inline_image(content)
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Заголовок Range с одним диапазоном -> (начало, конец включительно).
+    None - диапазон не разобран или их несколько: отдается весь файл."""
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            # bytes=-N - последние N байт
+            length = int(last)
+            if length == 0:
+                raise RangeNotSatisfiable()
+            start = max(size - length, 0)
+            end = size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    if start < 0 or start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+class FileRangeResponse(Response):
+    """Отдает часть файла. Если сервер поддерживает расширение ASGI zerocopy,
+    файл отправляется через sendfile, иначе читается частями в пуле потоков."""
+
+    def __init__(self, path: str, offset: int, length: int, media_type: str, headers: dict, status_code: int = 200):
+        super().__init__(status_code=status_code, headers={**headers, "Content-Length": str(length)}, media_type=media_type)
+        self.path = path
+        self.offset = offset
+        self.length = length
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        extensions = scope.get("extensions") or {}
+        if scope.get("method") == "HEAD" or self.length == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        with open(self.path, "rb") as file:
+            if "http.response.zerocopy" in extensions:
+                await send({"type": "http.response.zerocopy", "file": file, "offset": self.offset, "count": self.length})
+                return
+            file.seek(self.offset)
+            remaining = self.length
+            while remaining > 0:
+                chunk = await run_in_threadpool(file.read, min(MEDIA_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # Файл оказался короче ожидаемого: закрываем ответ
+                await send({"type": "http.response.body", "body": b""})
+
+
+def externalize_widgets() -> int:
+    """Переносит встроенные картинки уже сохраненных виджетов в хранилище"""
+    from sqlalchemy import select
+
+    import models
+    from database import SessionLocal
+
+    store = MediaStore()
+    changed = 0
+    with SessionLocal() as db:
+        for widget in db.execute(select(models.Widget)).scalars():
+            if not has_inline_media(widget.content):
+                continue
+            widget.content, _ = store.externalize(widget.content)
+            changed += 1
+        db.commit()
+    return changed
+
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:] != ["externalize"]:
+        print("Использование: python media.py externalize")
+        sys.exit(2)
+    print(f"Обновлено виджетов: {externalize_widgets()}")
@@ -0,0 +1,296 @@
+"""Метрики запросов и SQL: Prometheus /metrics, Server-Timing и журнал медленных запросов.
+
+MetricsMiddleware измеряет каждый запрос: время, размер ответа (после
+сжатия), код ответа и число одновременных запросов. SQL-запросы считаются
+через события движков SQLAlchemy (instrument_engine вызывается в database.py)
+и относятся к HTTP-запросу, в контексте которого выполнены: так видны
+маршруты с N+1 запросами к БД.
+
+Метрики хранятся в памяти процесса: при нескольких воркерах каждый отдает
+свои значения.
+"""
+import bisect
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+METRICS_PATH = os.environ.get("METRICS_PATH", "/metrics")
+# Если задан, /metrics требует заголовок Authorization: Bearer <токен>
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+METRICS_SERVER_TIMING = os.environ.get("METRICS_SERVER_TIMING", "true").lower() in ("1", "true", "yes")
+# Журнал медленных запросов выключен, пока порог не задан
+METRICS_SLOW_REQUEST_MS = float(os.environ.get("METRICS_SLOW_REQUEST_MS", "0"))
+METRICS_SLOW_MAX_STATEMENTS = int(os.environ.get("METRICS_SLOW_MAX_STATEMENTS", "50"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+UNMATCHED_ROUTE = "unmatched"
+
+
+class Histogram:
+    """Кумулятивная гистограмма в формате Prometheus"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+class MetricsRegistry:
+    """Счетчики и гистограммы по маршрутам"""
+
+    def __init__(self):
+        self.in_flight = 0
+        self._requests: Dict[Tuple[str, str, str], int] = {}
+        self._latency: Dict[Tuple[str, str], Histogram] = {}
+        self._sizes: Dict[Tuple[str, str], Histogram] = {}
+        self._statements: Dict[Tuple[str, str], Histogram] = {}
+        self._db_time: Dict[Tuple[str, str], Histogram] = {}
+        self._background_statements = 0
+        self._background_db_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float, size: int, stats: "RequestStats"):
+        key = (method, route)
+        with self._lock:
+            request_key = (method, route, str(status))
+            self._requests[request_key] = self._requests.get(request_key, 0) + 1
+            if key not in self._latency:
+                self._latency[key] = Histogram(LATENCY_BUCKETS)
+                self._sizes[key] = Histogram(SIZE_BUCKETS)
+                self._statements[key] = Histogram(STATEMENT_BUCKETS)
+                self._db_time[key] = Histogram(LATENCY_BUCKETS)
+            self._latency[key].observe(seconds)
+            self._sizes[key].observe(size)
+            self._statements[key].observe(stats.statements)
+            self._db_time[key].observe(stats.db_seconds)
+
+    def observe_background_statement(self, seconds: float):
+        """SQL вне HTTP-запросов: фоновая запись посещений, миграции и т.п."""
+        with self._lock:
+            self._background_statements += 1
+            self._background_db_seconds += seconds
+
+    def render(self) -> bytes:
+        """Текстовый формат Prometheus (version 0.0.4)"""
+        lines: List[str] = []
+        route_labels = ("method", "route")
+        with self._lock:
+            lines += [
+                "# HELP socialqr_http_requests_in_flight Запросы, обрабатываемые сейчас",
+                "# TYPE socialqr_http_requests_in_flight gauge",
+                f"socialqr_http_requests_in_flight {self.in_flight}",
+                "# HELP socialqr_http_requests_total Обработанные запросы",
+                "# TYPE socialqr_http_requests_total counter",
+            ]
+            for labels, count in sorted(self._requests.items()):
+                lines.append(f"socialqr_http_requests_total{_labels(('method', 'route', 'status'), labels)} {count}")
+            for name, help_text, histograms in (
+                ("socialqr_http_request_duration_seconds", "Время обработки запроса", self._latency),
+                ("socialqr_http_response_size_bytes", "Размер тела ответа (после сжатия)", self._sizes),
+                ("socialqr_db_statements_per_request", "SQL-запросов на один HTTP-запрос", self._statements),
+                ("socialqr_db_duration_seconds_per_request", "Время SQL-запросов на один HTTP-запрос", self._db_time),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                for labels, histogram in sorted(histograms.items()):
+                    cumulative = 0
+                    for bound, count in zip(list(histogram.buckets) + [None], histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound is None else _number(bound)
+                        bucket_labels = _labels(route_labels, labels, 'le="' + le + '"')
+                        lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(route_labels, labels)} {_number(histogram.sum)}")
+                    lines.append(f"{name}_count{_labels(route_labels, labels)} {histogram.count}")
+            lines += [
+                "# HELP socialqr_db_background_statements_total SQL-запросы вне HTTP-запросов",
+                "# TYPE socialqr_db_background_statements_total counter",
+                f"socialqr_db_background_statements_total {self._background_statements}",
+                "# HELP socialqr_db_background_duration_seconds_total Время SQL-запросов вне HTTP-запросов",
+                "# TYPE socialqr_db_background_duration_seconds_total counter",
+                f"socialqr_db_background_duration_seconds_total {_number(self._background_db_seconds)}",
+            ]
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+REGISTRY = MetricsRegistry()
+
+
+class RequestStats:
+    """SQL-запросы текущего HTTP-запроса; captured - тексты для журнала медленных запросов"""
+
+    __slots__ = ("statements", "db_seconds", "captured")
+
+    def __init__(self, capture: bool = False):
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.captured: Optional[List[Tuple[str, float]]] = [] if capture else None
+
+
+_current_request: ContextVar[Optional[RequestStats]] = ContextVar("metrics_request", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany, registry: MetricsRegistry):
+    started = conn.info.get("metrics_started")
+    if not started:
+        return
+    seconds = time.perf_counter() - started.pop()
+    stats = _current_request.get()
+    if stats is None:
+        registry.observe_background_statement(seconds)
+        return
+    stats.statements += 1
+    stats.db_seconds += seconds
+    if stats.captured is not None and len(stats.captured) < METRICS_SLOW_MAX_STATEMENTS:
+        stats.captured.append((statement, seconds))
+
+
+def _handle_error(exception_context):
+    # Запрос завершился ошибкой: after_cursor_execute не будет, снимаем отметку времени
+    started = exception_context.connection.info.get("metrics_started") if exception_context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def instrument_engine(engine, registry: MetricsRegistry = REGISTRY):
+    """Подключает подсчет SQL к синхронному движку (для AsyncEngine - к его sync_engine)"""
+    if not METRICS_ENABLED:
+        return
+    from sqlalchemy import event
+
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(
+        engine,
+        "after_cursor_execute",
+        lambda *args: _after_cursor_execute(*args, registry=registry),
+    )
+    event.listen(engine, "handle_error", _handle_error)
+
+
+def log_slow_request(method: str, route: str, path: str, status: int, seconds: float, stats: RequestStats):
+    """Печатает медленный запрос и его SQL, одинаковые запросы сгруппированы (признак N+1)"""
+    grouped: Dict[str, List[float]] = {}
+    for statement, statement_seconds in stats.captured or ():
+        grouped.setdefault(" ".join(statement.split()), []).append(statement_seconds)
+    lines = [
+        f"Медленный запрос: {method} {path} ({route}) -> {status} за {seconds * 1000:.1f} мс, "
+        f"SQL-запросов: {stats.statements} ({stats.db_seconds * 1000:.1f} мс)"
+    ]
+    for statement, timings in grouped.items():
+        lines.append(f"  {len(timings)}x {sum(timings) * 1000:.1f} мс  {statement[:500]}")
+    if stats.captured is not None and stats.statements > len(stats.captured):
+        lines.append(f"  ... не записано SQL-запросов: {stats.statements - len(stats.captured)}")
+    print("\n".join(lines))
+
+
+class MetricsMiddleware:
+    """ASGI-слой метрик; подключается самым внешним, чтобы мерить и сжатие, и CORS.
+
+    Сам отвечает на METRICS_PATH, поэтому метрики доступны без авторизации
+    админа (для Prometheus), но при заданном METRICS_TOKEN - только с токеном.
+    Заголовок Server-Timing добавляется к началу ответа: для потоковых
+    выгрузок он отражает время до первого байта.
+    """
+
+    def __init__(self, app, registry: MetricsRegistry = REGISTRY, path: str = METRICS_PATH,
+                 token: str = METRICS_TOKEN, server_timing: bool = METRICS_SERVER_TIMING,
+                 slow_request_ms: float = METRICS_SLOW_REQUEST_MS):
+        self.app = app
+        self.registry = registry
+        self.path = path
+        self.authorization = f"Bearer {token}".encode("latin-1") if token else None
+        self.server_timing = server_timing
+        self.slow_request_seconds = slow_request_ms / 1000
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        if scope["path"] == self.path and scope["method"] == "GET":
+            await self._send_metrics(scope, send)
+            return
+
+        stats = RequestStats(capture=self.slow_request_seconds > 0)
+        token = _current_request.set(stats)
+        started = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    elapsed_ms = (time.perf_counter() - started) * 1000
+                    value = (
+                        f"app;dur={elapsed_ms:.1f}, "
+                        f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.statements} SQL"'
+                    )
+                    message = dict(message)
+                    message["headers"] = list(message.get("headers", ())) + [(b"server-timing", value.encode("latin-1"))]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        self.registry.in_flight += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.registry.in_flight -= 1
+            _current_request.reset(token)
+            seconds = time.perf_counter() - started
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or UNMATCHED_ROUTE
+            self.registry.observe_request(scope["method"], route_path, status, seconds, size, stats)
+            if self.slow_request_seconds and seconds >= self.slow_request_seconds:
+                log_slow_request(scope["method"], route_path, scope["path"], status, seconds, stats)
+
+    async def _send_metrics(self, scope, send):
+        if self.authorization is not None:
+            authorization = next((value for name, value in scope["headers"] if name == b"authorization"), None)
+            if authorization != self.authorization:
+                await send({"type": "http.response.start", "status": 401, "headers": [(b"content-type", b"text/plain; charset=utf-8")]})
+                await send({"type": "http.response.body", "body": b"Unauthorized"})
+                return
+        body = self.registry.render()
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/plain; version=0.0.4; charset=utf-8"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                (b"cache-control", b"no-store"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,25 @@
+"""Однократная подготовка схемы БД: таблицы и недостающие колонки.
+
+Запускается при деплое до старта приложения:
+    python migrate.py
+
+Долгоживущие серверы по умолчанию делают то же самое сами при старте
+(DB_AUTO_MIGRATE=true). Для serverless-функций автосоздание лучше выключить:
+иначе каждый холодный старт проверяет схему и добавляет запросы к БД.
+"""
+import os
+
+# Создавать таблицы при старте приложения (main_app, main.py.fixed)
+DB_AUTO_MIGRATE = os.environ.get("DB_AUTO_MIGRATE", "true").lower() in ("1", "true", "yes")
+
+
+def run():
+    import database
+    import models
+
+    models.create_schema(database.get_engine())
+
+
+if __name__ == "__main__":
+    run()
+    print("Схема БД готова")
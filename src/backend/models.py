@@ -1,11 +1,39 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Text, DateTime, Float
+import json
+import os
+from sqlalchemy import JSON, Boolean, Column, ForeignKey, Integer, String, Text, DateTime, Float, Index, inspect
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.schema import CreateColumn
 from sqlalchemy.orm import relationship
+from sqlalchemy.types import TypeDecorator
 from sqlalchemy.ext.declarative import declarative_base
-from passlib.context import CryptContext
 from datetime import datetime
+from hashing import get_pwd_context
 
 Base = declarative_base()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# Хранение контента виджетов: json - нативная колонка (JSONB в PostgreSQL, JSON1 в SQLite),
+# text - прежняя текстовая колонка
+WIDGET_CONTENT_STORAGE = os.environ.get("WIDGET_CONTENT_STORAGE", "json").lower()
+
+class JSONText(TypeDecorator):
+    """JSON, хранящийся в текстовой колонке: словарь при записи сериализуется, при чтении разбирается"""
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, str):
+            return value
+        return json.dumps(value, ensure_ascii=False)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return json.loads(value)
+
+def widget_content_type():
+    if WIDGET_CONTENT_STORAGE == "text":
+        return JSONText
+    return JSON().with_variant(JSONB(), "postgresql")
 
 class User(Base):
     __tablename__ = "users"
@@ -13,18 +41,20 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, unique=True, index=True)
     name = Column(String)
+    email = Column(String, nullable=True)
     hashed_password = Column(String)
     is_admin = Column(Boolean, default=False)
+    disabled = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     widgets = relationship("Widget", back_populates="user", cascade="all, delete-orphan")
     subscription = relationship("Subscription", back_populates="user", uselist=False, cascade="all, delete-orphan")
 
     def set_password(self, password):
-        self.hashed_password = pwd_context.hash(password)
+        self.hashed_password = get_pwd_context().hash(password)
 
     def verify_password(self, password):
-        return pwd_context.verify(password, self.hashed_password)
+        return get_pwd_context().verify(password, self.hashed_password)
 
 class Admin(Base):
     __tablename__ = "admins"
@@ -35,17 +65,17 @@ class Admin(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
     def set_password(self, password):
-        self.hashed_password = pwd_context.hash(password)
+        self.hashed_password = get_pwd_context().hash(password)
 
     def verify_password(self, password):
-        return pwd_context.verify(password, self.hashed_password)
+        return get_pwd_context().verify(password, self.hashed_password)
 
 class Widget(Base):
     __tablename__ = "widgets"
 
     id = Column(Integer, primary_key=True, index=True)
     type = Column(String)  # Тип виджета (text, image, etc.)
-    content = Column(Text)  # JSON-контент виджета
+    content = Column(widget_content_type())  # JSON-контент виджета
     position_x = Column(Float)
     position_y = Column(Float)
     width = Column(Float)
@@ -66,4 +96,68 @@ class Subscription(Base):
     is_active = Column(Boolean, default=False)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), unique=True)
 
-    user = relationship("User", back_populates="subscription") 
\ No newline at end of file
+    user = relationship("User", back_populates="subscription") 
+
+class QRCode(Base):
+    __tablename__ = "qr_codes"
+
+    id = Column(Integer, primary_key=True)
+    slug = Column(String, unique=True, index=True, nullable=False)  # публичный id в ссылке /q/{slug}
+    owner = Column(String, index=True, nullable=False)  # имя пользователя-владельца
+    url = Column(String, nullable=False)
+    title = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class QRVisitCount(Base):
+    __tablename__ = "qr_visit_counts"
+
+    qr_id = Column(String, primary_key=True)  # id QR-кода
+    visits = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# Общее число посещений одной строкой: увеличивается той же транзакцией, что и счетчики кодов
+class QRVisitTotal(Base):
+    __tablename__ = "qr_visit_totals"
+
+    id = Column(Integer, primary_key=True)  # всегда VISIT_TOTAL_ID
+    visits = Column(Integer, default=0, nullable=False)
+
+VISIT_TOTAL_ID = 1
+
+class QRScanBucket(Base):
+    __tablename__ = "qr_scan_buckets"
+
+    qr_id = Column(String, primary_key=True)
+    granularity = Column(String(1), primary_key=True)  # m - минута, h - час, d - день
+    bucket_start = Column(DateTime, primary_key=True)
+    count = Column(Integer, default=0, nullable=False)
+
+    # Для графиков по всей платформе (без фильтра по QR-коду)
+    __table_args__ = (Index("ix_qr_scan_buckets_granularity_start", "granularity", "bucket_start"),)
+
+def create_schema(bind):
+    """Создает таблицы и добавляет колонки, появившиеся в моделях позже.
+
+    create_all не меняет существующие таблицы, а миграций в проекте нет,
+    поэтому недостающие колонки (только nullable) добавляются через ALTER TABLE.
+    """
+    Base.metadata.create_all(bind=bind)
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    ddl = CreateColumn(column).compile(dialect=bind.dialect)
+                    conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+        if bind.dialect.name == "postgresql" and WIDGET_CONTENT_STORAGE != "text":
+            # Текстовая колонка прежних версий переводится в JSONB один раз
+            content = next(column for column in inspector.get_columns("widgets") if column["name"] == "content")
+            if not isinstance(content["type"], JSONB):
+                conn.exec_driver_sql("ALTER TABLE widgets ALTER COLUMN content TYPE JSONB USING content::jsonb")
+        # Общий итог посещений для БД прежних версий считается один раз при миграции
+        conn.exec_driver_sql(
+            "INSERT INTO qr_visit_totals (id, visits) "
+            f"SELECT {VISIT_TOTAL_ID}, (SELECT coalesce(sum(visits), 0) FROM qr_visit_counts) "
+            "WHERE NOT EXISTS (SELECT 1 FROM qr_visit_totals)"
+        )
@@ -0,0 +1,107 @@
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+# Настройки кеша публичных страниц
+PROFILE_CACHE_SIZE = int(os.environ.get("PROFILE_CACHE_SIZE", "2000"))
+PROFILE_MAX_AGE = int(os.environ.get("PROFILE_MAX_AGE", "60"))
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Проверяет заголовок If-None-Match (список тегов, слабые теги, *)"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate == etag:
+            return True
+    return False
+
+
+class ProfileCache:
+    """LRU-кеш готовых JSON-ответов публичных страниц: ключ -> (байты, ETag).
+
+    Запись сбрасывается при любом изменении виджетов владельца. Параллельные
+    промахи по одному ключу строят ответ один раз (важно при всплесках сканов).
+    """
+
+    def __init__(self, maxsize: int = PROFILE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[bytes, str]]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # Сколько корутин держат или ждут замок ключа
+        self._lock_users: Dict[str, int] = {}
+
+    def get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    async def get_or_build(self, key: str, build: Callable[[], Awaitable[Optional[bytes]]]) -> Optional[Tuple[bytes, str]]:
+        """Возвращает (байты, ETag); build вызывается только при промахе.
+        Если build вернул None (страницы нет), ничего не кешируется."""
+        entry = self.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._lock_users[key] = self._lock_users.get(key, 0) + 1
+        try:
+            async with lock:
+                entry = self.get(key)
+                if entry is not None:
+                    self.hits += 1
+                    return entry
+                self.misses += 1
+                generation = self._generations.get(key, 0)
+                body = await build()
+                if body is None:
+                    return None
+                entry = (body, make_etag(body))
+                # Пока строили ответ, страница могла измениться - такой результат не кешируем
+                if self._generations.get(key, 0) == generation:
+                    self._put(key, entry)
+            return entry
+        finally:
+            # Замок и поколение удаляются, только когда их никто не держит и не ждет:
+            # иначе ожидающий сохранил бы ответ, построенный до сброса
+            self._lock_users[key] -= 1
+            if not self._lock_users[key]:
+                del self._lock_users[key]
+                self._locks.pop(key, None)
+                self._generations.pop(key, None)
+
+    def invalidate(self, key: str):
+        self._entries.pop(key, None)
+        # Поколение нужно, только пока по ключу строят ответ или ждут замок
+        if key in self._locks:
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def _put(self, key: str, entry: Tuple[bytes, str]):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
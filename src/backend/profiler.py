@@ -0,0 +1,317 @@
+"""Сэмплирующий профилировщик, включаемый без перезапуска процесса.
+
+Фоновый поток раз в interval секунд снимает стеки всех потоков через
+sys._current_frames() и складывает их в формат collapsed stacks
+("поток;функция;функция N"), который понимают flamegraph.pl, speedscope
+и inferno. Поток работает, только пока есть активные сессии: в остальное
+время профилировщик ничего не стоит.
+
+Сессии:
+- по времени - все потоки в течение N секунд;
+- по запросам - пока обрабатываются следующие N запросов, путь которых
+  совпадает с шаблоном (fnmatch, например /api/admin/*);
+- по заголовку - один запрос с заголовком X-Profile: <PROFILER_TOKEN>;
+  результат сохраняется в PROFILER_DIR, а его id возвращается в X-Profile-Id.
+
+Запросы в одном event loop выполняются вперемешку, поэтому в сессии
+по запросам попадают и стеки соседних запросов.
+"""
+import asyncio
+import fnmatch
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Dict, List, Optional
+
+PROFILER_INTERVAL_MS = float(os.environ.get("PROFILER_INTERVAL_MS", "5"))
+PROFILER_MAX_SECONDS = float(os.environ.get("PROFILER_MAX_SECONDS", "60"))
+# Профилирование по заголовку выключено, пока токен не задан
+PROFILER_TOKEN = os.environ.get("PROFILER_TOKEN", "")
+# Результаты по заголовку - файлы: их может прочитать любой воркер на этом сервере
+PROFILER_DIR = os.environ.get("PROFILER_DIR", os.path.join(tempfile.gettempdir(), "socialqr-profiles"))
+PROFILER_KEEP_RESULTS = int(os.environ.get("PROFILER_KEEP_RESULTS", "50"))
+
+# Листовые функции простаивающих потоков (конец пути к файлу, функция):
+# ожидание в пуле потоков, в select, на блокировке, в потоке соединения aiosqlite
+IDLE_LEAVES = (
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("concurrent/futures/thread.py", "_worker"),
+    ("aiosqlite/core.py", "_connection_worker_thread"),
+)
+
+
+class ProfileSession:
+    """Накопитель стеков одной сессии"""
+
+    def __init__(self, kind: str, description: str, include_idle: bool = False):
+        self.id = uuid.uuid4().hex[:16]
+        self.kind = kind
+        self.description = description
+        self.include_idle = include_idle
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.active = False
+        self.done = threading.Event()
+
+    def finish(self):
+        self.active = False
+        if self.finished_at is None:
+            self.finished_at = time.time()
+        self.done.set()
+
+    def collapsed(self) -> str:
+        """Формат collapsed stacks: по строке на стек, от корня к листу, и число сэмплов"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "description": self.description,
+            "samples": self.samples,
+            "stacks": len(self.stacks),
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class RouteSession(ProfileSession):
+    """Сэмплирует, пока обрабатывается хотя бы один подходящий запрос"""
+
+    def __init__(self, pattern: str, count: int):
+        super().__init__("requests", f"{count} запросов {pattern}")
+        self.pattern = pattern
+        self.remaining = count
+        self.in_flight = 0
+
+    def matches(self, path: str) -> bool:
+        return self.remaining > 0 and fnmatch.fnmatchcase(path, self.pattern)
+
+
+class SamplingProfiler:
+    def __init__(self, interval_ms: float = PROFILER_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.total_samples = 0
+        self._sessions: List[ProfileSession] = []
+        self._route_sessions: List[RouteSession] = []
+        self._labels: Dict[object, str] = {}
+        self._idle: Dict[object, bool] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def armed(self) -> bool:
+        """Есть сессии, ожидающие запросов; проверяется middleware на каждом запросе"""
+        return bool(self._route_sessions)
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            filename = code.co_filename
+            parts = filename.replace("\\", "/").rsplit("/", 2)
+            short = "/".join(parts[-2:]) if len(parts) > 1 else filename
+            label = f"{code.co_name} ({short}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+
+    def _is_idle(self, code) -> bool:
+        idle = self._idle.get(code)
+        if idle is None:
+            filename = code.co_filename.replace("\\", "/")
+            idle = any(filename.endswith(path) and code.co_name == name for path, name in IDLE_LEAVES)
+            self._idle[code] = idle
+        return idle
+
+    def _sample(self, thread_names: Dict[int, str]):
+        own = threading.get_ident()
+        with self._lock:
+            sessions = [session for session in self._sessions if session.active]
+        if not sessions:
+            return
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            idle = self._is_idle(frame.f_code)
+            labels = []
+            while frame is not None:
+                labels.append(self._label(frame.f_code))
+                frame = frame.f_back
+            labels.append(thread_names.get(thread_id, f"thread-{thread_id}"))
+            stack = ";".join(reversed(labels))
+            for session in sessions:
+                if idle and not session.include_idle:
+                    continue
+                session.stacks[stack] += 1
+                session.samples += 1
+        self.total_samples += 1
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._sessions:
+                    self._thread = None
+                    return
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            self._sample(thread_names)
+            time.sleep(self.interval)
+
+    def _add(self, session: ProfileSession):
+        with self._lock:
+            self._sessions.append(session)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+
+    def _remove(self, session: ProfileSession):
+        session.finish()
+        with self._lock:
+            if session in self._sessions:
+                self._sessions.remove(session)
+            if session in self._route_sessions:
+                self._route_sessions.remove(session)
+
+    async def profile_for(self, seconds: float, include_idle: bool = False) -> ProfileSession:
+        """Сэмплирует все потоки seconds секунд"""
+        session = ProfileSession("time", f"{seconds:g} с", include_idle)
+        session.active = True
+        self._add(session)
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self._remove(session)
+        return session
+
+    async def profile_requests(self, pattern: str, count: int, timeout: float) -> RouteSession:
+        """Сэмплирует, пока не обработаются count запросов по шаблону (или timeout секунд)"""
+        session = RouteSession(pattern, count)
+        with self._lock:
+            self._route_sessions.append(session)
+        self._add(session)
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, session.done.wait, timeout)
+        finally:
+            self._remove(session)
+        return session
+
+    def request_started(self, path: str) -> List[RouteSession]:
+        matched = []
+        with self._lock:
+            for session in self._route_sessions:
+                if session.matches(path):
+                    session.remaining -= 1
+                    session.in_flight += 1
+                    session.active = True
+                    matched.append(session)
+        return matched
+
+    def request_finished(self, sessions: List[RouteSession]):
+        with self._lock:
+            for session in sessions:
+                session.in_flight -= 1
+                session.active = session.in_flight > 0
+                if session.remaining <= 0 and session.in_flight == 0:
+                    session.finish()
+
+    def start_request_session(self, description: str) -> ProfileSession:
+        session = ProfileSession("header", description)
+        session.active = True
+        self._add(session)
+        return session
+
+    def finish_request_session(self, session: ProfileSession):
+        self._remove(session)
+        save_result(session)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "running": self._thread is not None,
+                "interval_ms": self.interval * 1000,
+                "total_samples": self.total_samples,
+                "sessions": [session.to_dict() for session in self._sessions],
+                "header_profiling": bool(PROFILER_TOKEN),
+            }
+
+
+def _result_path(profile_id: str) -> str:
+    return os.path.join(PROFILER_DIR, f"{profile_id}.collapsed")
+
+
+def save_result(session: ProfileSession):
+    """Сохраняет стеки сессии в файл и удаляет самые старые сверх PROFILER_KEEP_RESULTS"""
+    try:
+        os.makedirs(PROFILER_DIR, exist_ok=True)
+        with open(_result_path(session.id), "w", encoding="utf-8") as output:
+            output.write(session.collapsed())
+        results = sorted(
+            (entry for entry in os.scandir(PROFILER_DIR) if entry.name.endswith(".collapsed")),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        for entry in results[:-PROFILER_KEEP_RESULTS]:
+            os.remove(entry.path)
+    except OSError as e:
+        print(f"Ошибка при сохранении профиля: {e}")
+
+
+def load_result(profile_id: str) -> Optional[str]:
+    if not profile_id.isalnum():
+        return None
+    try:
+        with open(_result_path(profile_id), encoding="utf-8") as result:
+            return result.read()
+    except FileNotFoundError:
+        return None
+
+
+class ProfilerMiddleware:
+    """Подключает запросы к сессиям профилировщика.
+
+    Пока сессий по запросам нет и профилирование по заголовку выключено,
+    запрос проходит без дополнительной работы.
+    """
+
+    def __init__(self, app, profiler: SamplingProfiler, token: str = PROFILER_TOKEN):
+        self.app = app
+        self.profiler = profiler
+        self.token = token.encode("latin-1") if token else None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (self.token is None and not self.profiler.armed):
+            await self.app(scope, receive, send)
+            return
+
+        header_session = None
+        if self.token is not None:
+            for name, value in scope["headers"]:
+                if name == b"x-profile" and value == self.token:
+                    header_session = self.profiler.start_request_session(f"{scope['method']} {scope['path']}")
+                    break
+        route_sessions = self.profiler.request_started(scope["path"]) if self.profiler.armed else []
+
+        if header_session is not None:
+            profile_id = header_session.id.encode("latin-1")
+
+            async def send_with_id(message):
+                if message["type"] == "http.response.start":
+                    message = dict(message)
+                    message["headers"] = list(message.get("headers", ())) + [(b"x-profile-id", profile_id)]
+                await send(message)
+        else:
+            send_with_id = send
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            if route_sessions:
+                self.profiler.request_finished(route_sessions)
+            if header_session is not None:
+                self.profiler.finish_request_session(header_session)
@@ -0,0 +1,334 @@
+"""Пакетный рендеринг QR-кодов в фоновых задачах.
+
+Задачу выполняет воркер, который ее создал, но состояние и готовые
+изображения сохраняются в QR_JOB_DIR/<id задачи>: состояние и архив
+доступны любому воркеру этого сервера. Для нескольких серверов QR_JOB_DIR
+должен указывать на общий том.
+"""
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
+
+import qr_render
+from fast_json import dumps
+
+# Настройки пакетной генерации
+QR_JOB_WORKERS = int(os.environ.get("QR_JOB_WORKERS", "0")) or (os.cpu_count() or 1)
+QR_JOB_MAX_JOBS = int(os.environ.get("QR_JOB_MAX_JOBS", "50"))
+QR_BATCH_MAX_ITEMS = int(os.environ.get("QR_BATCH_MAX_ITEMS", "5000"))
+QR_JOB_DIR = os.environ.get("QR_JOB_DIR", os.path.join(tempfile.gettempdir(), "socialqr-jobs"))
+# Задачи других воркеров читаются из QR_JOB_DIR с этим интервалом (секунды);
+# если задача столько секунд не продвигается, ее воркер считается остановленным
+QR_JOB_POLL_INTERVAL = 0.5
+QR_JOB_STALL_TIMEOUT = 60
+
+STATE_FILE = "state.json"
+ITEMS_DIR = "items"
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """Пул процессов создается при первой пакетной задаче"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=QR_JOB_WORKERS)
+    return _pool
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _write_file(path: str, data: bytes):
+    """Запись через временный файл: читатели не видят файл недописанным"""
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as output:
+        output.write(data)
+    os.replace(temporary, path)
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as source:
+        return source.read()
+
+
+def _zip_name(item: str) -> str:
+    """Имя файла в архиве: без номера, задающего порядок"""
+    return item.split("-", 1)[1]
+
+
+class QRBatchJob:
+    """Пакетная задача: готовые изображения сохраняются файлами в каталог задачи"""
+
+    def __init__(self, records: List[dict], fmt: str, size: int, ecl: str, margin: int):
+        self.id = uuid.uuid4().hex
+        self.path = os.path.join(QR_JOB_DIR, self.id)
+        self.records = records
+        self.fmt = fmt
+        self.size = size
+        self.ecl = ecl
+        self.margin = margin
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.items: List[str] = []
+        self.failed: List[str] = []
+        self._changed = asyncio.Condition()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "format": self.fmt,
+            "total": len(self.records),
+            "completed": len(self.items),
+            "failed": self.failed,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "qrcodes": [record["id"] for record in self.records],
+        }
+
+    async def _save_state(self):
+        await asyncio.to_thread(_write_file, os.path.join(self.path, STATE_FILE), dumps(self.to_dict()))
+
+    async def prepare(self):
+        """Создает каталог задачи: с этого момента она видна другим воркерам"""
+        await asyncio.to_thread(os.makedirs, os.path.join(self.path, ITEMS_DIR))
+        await self._save_state()
+
+    async def _finish(self):
+        self.finished_at = time.time()
+        try:
+            await self._save_state()
+        except OSError as e:
+            print(f"Ошибка при сохранении задачи {self.id}: {e}")
+        await self._notify()
+
+    async def cancel(self):
+        """Отменяет задачу, которая не успела начаться"""
+        self.status = "failed"
+        self.error = "Задача отменена"
+        await self._finish()
+
+    async def _notify(self):
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def _render(self, pool: ProcessPoolExecutor, record: dict):
+        loop = asyncio.get_running_loop()
+        try:
+            body = await loop.run_in_executor(
+                pool, qr_render.render, record["url"], self.fmt, self.size, self.ecl, self.margin
+            )
+        except Exception:
+            body = None
+        return record, body
+
+    async def run(self):
+        """Рендерит изображения в пуле процессов, используя все ядра"""
+        self.status = "running"
+        renders: List[asyncio.Future] = []
+        try:
+            await self._save_state()
+            pool = get_pool()
+            renders = [asyncio.ensure_future(self._render(pool, record)) for record in self.records]
+            for next_done in asyncio.as_completed(renders):
+                record, body = await next_done
+                if body is None:
+                    self.failed.append(record["id"])
+                    await self._save_state()
+                else:
+                    # Файлы пишутся по одному: номер в имени задает порядок для других воркеров
+                    item = f"{len(self.items):08d}-{record['id']}.{self.fmt}"
+                    await asyncio.to_thread(_write_file, os.path.join(self.path, ITEMS_DIR, item), body)
+                    self.items.append(item)
+                await self._notify()
+            self.status = "done"
+        except asyncio.CancelledError:
+            # Остановка воркера: ожидающие архив не должны ждать вечно
+            self.status = "failed"
+            self.error = "Задача отменена"
+            raise
+        except Exception as e:
+            self.status = "failed"
+            self.error = str(e)
+        finally:
+            for render in renders:
+                render.cancel()
+            await self._finish()
+
+    async def iter_items(self) -> AsyncIterator[Tuple[str, bytes]]:
+        """Отдает готовые изображения, дожидаясь новых, пока задача не завершится"""
+        sent = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: sent < len(self.items) or self.done)
+            while sent < len(self.items):
+                item = self.items[sent]
+                yield _zip_name(item), await asyncio.to_thread(_read_file, os.path.join(self.path, ITEMS_DIR, item))
+                sent += 1
+            if self.done and sent >= len(self.items):
+                return
+
+
+class StoredJob:
+    """Задача другого воркера, прочитанная из ее каталога"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.state: dict = {}
+        self.items: List[str] = []
+
+    @property
+    def id(self) -> str:
+        return self.state["id"]
+
+    @property
+    def fmt(self) -> str:
+        return self.state["format"]
+
+    @property
+    def done(self) -> bool:
+        return self.state.get("status") in ("done", "failed")
+
+    def _load(self):
+        # Сначала состояние, потом файлы: у завершенной задачи список файлов уже полный
+        self.state = json.loads(_read_file(os.path.join(self.path, STATE_FILE)))
+        items = os.listdir(os.path.join(self.path, ITEMS_DIR))
+        self.items = sorted(item for item in items if not item.endswith(".tmp"))
+
+    async def reload(self):
+        await asyncio.to_thread(self._load)
+
+    def to_dict(self) -> dict:
+        return {**self.state, "completed": len(self.items)}
+
+    async def iter_items(self) -> AsyncIterator[Tuple[str, bytes]]:
+        """Отдает изображения по мере появления файлов, пока задача не завершится"""
+        sent = 0
+        progress_at = time.monotonic()
+        while True:
+            while sent < len(self.items):
+                item = self.items[sent]
+                yield _zip_name(item), await asyncio.to_thread(_read_file, os.path.join(self.path, ITEMS_DIR, item))
+                sent += 1
+                progress_at = time.monotonic()
+            if self.done or time.monotonic() - progress_at > QR_JOB_STALL_TIMEOUT:
+                return
+            await asyncio.sleep(QR_JOB_POLL_INTERVAL)
+            await self.reload()
+
+
+class _ZipStream:
+    """Файловый объект без seek: zipfile пишет в него, а мы забираем байты по частям"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+async def zip_stream(job: Union[QRBatchJob, StoredJob]) -> AsyncIterator[bytes]:
+    """ZIP-архив, который отдается клиенту по мере рендеринга изображений"""
+    stream = _ZipStream()
+    # PNG уже сжат zlib, повторно сжимать его бессмысленно
+    compression = zipfile.ZIP_STORED if job.fmt == "png" else zipfile.ZIP_DEFLATED
+    with zipfile.ZipFile(stream, mode="w", compression=compression) as archive:
+        async for name, body in job.iter_items():
+            archive.writestr(name, body)
+            yield stream.drain()
+    yield stream.drain()
+
+
+class JobRegistry:
+    """Задачи процесса и сохраненные в directory задачи других воркеров.
+
+    В памяти остаются последние задачи процесса, на диске - последние max_jobs
+    задач всех воркеров; самые старые завершенные удаляются.
+    """
+
+    def __init__(self, max_jobs: int = QR_JOB_MAX_JOBS, directory: str = QR_JOB_DIR):
+        self.max_jobs = max_jobs
+        self.directory = directory
+        self._jobs: "OrderedDict[str, QRBatchJob]" = OrderedDict()
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def _cleanup(self):
+        """Удаляет каталоги самых старых завершенных задач сверх max_jobs"""
+        jobs = []
+        for entry in os.scandir(self.directory):
+            try:
+                state = json.loads(_read_file(os.path.join(entry.path, STATE_FILE)))
+            except (OSError, ValueError):
+                continue
+            jobs.append((state["created_at"], state["status"], entry.path))
+        jobs.sort()
+        for _, status, path in jobs[:-self.max_jobs]:
+            if status in ("done", "failed"):
+                shutil.rmtree(path, ignore_errors=True)
+
+    async def start(self, job: QRBatchJob) -> QRBatchJob:
+        await asyncio.to_thread(os.makedirs, self.directory, exist_ok=True)
+        await asyncio.to_thread(self._cleanup)
+        job.path = os.path.join(self.directory, job.id)
+        await job.prepare()
+        self._jobs[job.id] = job
+        task = asyncio.get_running_loop().create_task(job.run())
+        self._tasks[job.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.id, None))
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self.max_jobs:
+                break
+            if self._jobs[job_id].done:
+                del self._jobs[job_id]
+        return job
+
+    async def get(self, job_id: str) -> Optional[Union[QRBatchJob, StoredJob]]:
+        job = self._jobs.get(job_id)
+        if job is not None or not job_id.isalnum():
+            return job
+        stored = StoredJob(os.path.join(self.directory, job_id))
+        try:
+            await stored.reload()
+        except (OSError, ValueError):
+            return None
+        return stored
+
+    async def cancel_all(self):
+        """Отменяет задачи процесса и дожидается, пока они сохранят состояние"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Задача, отмененная до начала, не выполняет run() и не отмечает себя сама
+        for job in self._jobs.values():
+            if not job.done:
+                await job.cancel()
@@ -0,0 +1,452 @@
+"""Генерация QR-кодов (ISO/IEC 18004, байтовый режим) в PNG и SVG на чистом Python."""
+import hashlib
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+# Настройки кеша готовых изображений
+QR_CACHE_SIZE = int(os.environ.get("QR_CACHE_SIZE", "1000"))
+QR_CACHE_MAX_BYTES = int(os.environ.get("QR_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+QR_MAX_IMAGE_SIZE = 4096
+QR_MAX_MARGIN = 32
+
+ERROR_CORRECTION_LEVELS = ("L", "M", "Q", "H")
+_FORMAT_BITS = {"L": 1, "M": 0, "Q": 3, "H": 2}
+
+# Число кодовых слов коррекции на блок и число блоков: [уровень][версия], индекс 0 не используется
+_ECC_CODEWORDS_PER_BLOCK = {
+    "L": (-1, 7, 10, 15, 20, 26, 18, 20, 24, 30, 18, 20, 24, 26, 30, 22, 24, 28, 30, 28, 28, 28, 28, 30, 30, 26, 28, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+    "M": (-1, 10, 16, 26, 18, 24, 16, 18, 22, 22, 26, 30, 22, 22, 24, 24, 28, 28, 26, 26, 26, 26, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28),
+    "Q": (-1, 13, 22, 18, 26, 18, 24, 18, 22, 20, 24, 28, 26, 24, 20, 30, 24, 28, 28, 26, 30, 28, 30, 30, 30, 30, 28, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+    "H": (-1, 17, 28, 22, 16, 22, 28, 26, 26, 24, 28, 24, 28, 22, 24, 24, 30, 28, 28, 26, 28, 30, 24, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+}
+_NUM_ERROR_CORRECTION_BLOCKS = {
+    "L": (-1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 4, 4, 4, 4, 4, 6, 6, 6, 6, 7, 8, 8, 9, 9, 10, 12, 12, 12, 13, 14, 15, 16, 17, 18, 19, 19, 20, 21, 22, 24, 25),
+    "M": (-1, 1, 1, 1, 2, 2, 4, 4, 4, 5, 5, 5, 8, 9, 9, 10, 10, 11, 13, 14, 16, 17, 17, 18, 20, 21, 23, 25, 26, 28, 29, 31, 33, 35, 37, 38, 40, 43, 45, 47, 49),
+    "Q": (-1, 1, 1, 2, 2, 4, 4, 6, 6, 8, 8, 8, 10, 12, 16, 12, 17, 16, 18, 21, 20, 23, 23, 25, 27, 29, 34, 34, 35, 38, 40, 43, 45, 48, 51, 53, 56, 59, 62, 65, 68),
+    "H": (-1, 1, 1, 2, 4, 4, 4, 5, 6, 8, 8, 11, 11, 16, 16, 18, 16, 19, 21, 25, 25, 25, 34, 30, 32, 35, 37, 40, 42, 45, 48, 51, 54, 57, 60, 63, 66, 70, 74, 77, 81),
+}
+
+# Таблицы логарифмов в GF(2^8) с порождающим многочленом 0x11D
+_GF_EXP = [0] * 512
+_GF_LOG = [0] * 256
+_value = 1
+for _i in range(255):
+    _GF_EXP[_i] = _value
+    _GF_LOG[_value] = _i
+    _value <<= 1
+    if _value & 0x100:
+        _value ^= 0x11D
+for _i in range(255, 512):
+    _GF_EXP[_i] = _GF_EXP[_i - 255]
+
+
+class QRDataTooLong(ValueError):
+    """Данные не помещаются в QR-код версии 40 с выбранным уровнем коррекции"""
+
+
+def _gf_mul(x: int, y: int) -> int:
+    if x == 0 or y == 0:
+        return 0
+    return _GF_EXP[_GF_LOG[x] + _GF_LOG[y]]
+
+
+def _rs_divisor(degree: int) -> List[int]:
+    result = [0] * (degree - 1) + [1]
+    root = 1
+    for _ in range(degree):
+        for j in range(degree):
+            result[j] = _gf_mul(result[j], root)
+            if j + 1 < degree:
+                result[j] ^= result[j + 1]
+        root = _gf_mul(root, 0x02)
+    return result
+
+
+def _rs_remainder(data: List[int], divisor: List[int]) -> List[int]:
+    result = [0] * len(divisor)
+    for byte in data:
+        factor = byte ^ result.pop(0)
+        result.append(0)
+        if factor:
+            for i, coef in enumerate(divisor):
+                result[i] ^= _gf_mul(coef, factor)
+    return result
+
+
+def _raw_data_modules(version: int) -> int:
+    result = (16 * version + 128) * version + 64
+    if version >= 2:
+        num_align = version // 7 + 2
+        result -= (25 * num_align - 10) * num_align - 55
+        if version >= 7:
+            result -= 36
+    return result
+
+
+def _data_codewords(version: int, ecl: str) -> int:
+    return (_raw_data_modules(version) // 8
+            - _ECC_CODEWORDS_PER_BLOCK[ecl][version] * _NUM_ERROR_CORRECTION_BLOCKS[ecl][version])
+
+
+def _alignment_positions(version: int) -> List[int]:
+    if version == 1:
+        return []
+    size = version * 4 + 17
+    num_align = version // 7 + 2
+    step = (version * 8 + num_align * 3 + 5) // (num_align * 4 - 4) * 2
+    result = [size - 7 - i * step for i in range(num_align - 1)] + [6]
+    return list(reversed(result))
+
+
+def _encode_codewords(data: bytes, ecl: str) -> Tuple[int, List[int]]:
+    """Подбирает минимальную версию и возвращает (версия, кодовые слова данных)"""
+    for version in range(1, 41):
+        count_bits = 8 if version <= 9 else 16
+        capacity_bits = _data_codewords(version, ecl) * 8
+        if 4 + count_bits + len(data) * 8 <= capacity_bits:
+            break
+    else:
+        raise QRDataTooLong("Данные слишком длинные для QR-кода")
+
+    bits: List[int] = []
+
+    def append(value: int, length: int):
+        bits.extend((value >> i) & 1 for i in reversed(range(length)))
+
+    append(0b0100, 4)
+    append(len(data), count_bits)
+    for byte in data:
+        append(byte, 8)
+    append(0, min(4, capacity_bits - len(bits)))
+    append(0, -len(bits) % 8)
+
+    codewords = [int("".join(map(str, bits[i:i + 8])), 2) for i in range(0, len(bits), 8)]
+    pad = 0xEC
+    while len(codewords) < capacity_bits // 8:
+        codewords.append(pad)
+        pad ^= 0xEC ^ 0x11
+    return version, codewords
+
+
+def _add_ecc_and_interleave(data: List[int], version: int, ecl: str) -> List[int]:
+    num_blocks = _NUM_ERROR_CORRECTION_BLOCKS[ecl][version]
+    block_ecc_len = _ECC_CODEWORDS_PER_BLOCK[ecl][version]
+    raw_codewords = _raw_data_modules(version) // 8
+    num_short_blocks = num_blocks - raw_codewords % num_blocks
+    short_block_len = raw_codewords // num_blocks
+
+    divisor = _rs_divisor(block_ecc_len)
+    blocks = []
+    k = 0
+    for i in range(num_blocks):
+        length = short_block_len - block_ecc_len + (0 if i < num_short_blocks else 1)
+        block = data[k:k + length]
+        k += length
+        ecc = _rs_remainder(block, divisor)
+        if i < num_short_blocks:
+            block.append(0)
+        blocks.append(block + ecc)
+
+    result = []
+    for i in range(len(blocks[0])):
+        for j, block in enumerate(blocks):
+            # Пропускаем дополнительный байт коротких блоков
+            if i != short_block_len - block_ecc_len or j >= num_short_blocks:
+                result.append(block[i])
+    return result
+
+
+_MASKS = (
+    lambda x, y: (x + y) % 2 == 0,
+    lambda x, y: y % 2 == 0,
+    lambda x, y: x % 3 == 0,
+    lambda x, y: (x + y) % 3 == 0,
+    lambda x, y: (x // 3 + y // 2) % 2 == 0,
+    lambda x, y: x * y % 2 + x * y % 3 == 0,
+    lambda x, y: (x * y % 2 + x * y % 3) % 2 == 0,
+    lambda x, y: ((x + y) % 2 + x * y % 3) % 2 == 0,
+)
+
+_FINDER_LIKE = ((1, 0, 1, 1, 1, 0, 1, 0, 0, 0, 0), (0, 0, 0, 0, 1, 0, 1, 1, 1, 0, 1))
+
+
+class _Matrix:
+    def __init__(self, version: int, ecl: str):
+        self.version = version
+        self.ecl = ecl
+        self.size = version * 4 + 17
+        self.modules = [[False] * self.size for _ in range(self.size)]
+        self.is_function = [[False] * self.size for _ in range(self.size)]
+
+    def set_function(self, x: int, y: int, dark: bool):
+        self.modules[y][x] = dark
+        self.is_function[y][x] = True
+
+    def draw_function_patterns(self):
+        size = self.size
+        for i in range(size):
+            self.set_function(6, i, i % 2 == 0)
+            self.set_function(i, 6, i % 2 == 0)
+        for cx, cy in ((3, 3), (size - 4, 3), (3, size - 4)):
+            for dy in range(-4, 5):
+                for dx in range(-4, 5):
+                    x, y = cx + dx, cy + dy
+                    if 0 <= x < size and 0 <= y < size:
+                        self.set_function(x, y, max(abs(dx), abs(dy)) not in (2, 4))
+        positions = _alignment_positions(self.version)
+        last = len(positions) - 1
+        for i, cx in enumerate(positions):
+            for j, cy in enumerate(positions):
+                if (i, j) in ((0, 0), (0, last), (last, 0)):
+                    continue
+                for dy in range(-2, 3):
+                    for dx in range(-2, 3):
+                        self.set_function(cx + dx, cy + dy, max(abs(dx), abs(dy)) != 1)
+        self.draw_format_bits(0)
+        self.draw_version()
+
+    def draw_format_bits(self, mask: int):
+        data = _FORMAT_BITS[self.ecl] << 3 | mask
+        rem = data
+        for _ in range(10):
+            rem = (rem << 1) ^ ((rem >> 9) * 0x537)
+        bits = (data << 10 | rem) ^ 0x5412
+        bit = lambda i: (bits >> i) & 1 != 0
+        size = self.size
+        for i in range(6):
+            self.set_function(8, i, bit(i))
+        self.set_function(8, 7, bit(6))
+        self.set_function(8, 8, bit(7))
+        self.set_function(7, 8, bit(8))
+        for i in range(9, 15):
+            self.set_function(14 - i, 8, bit(i))
+        for i in range(8):
+            self.set_function(size - 1 - i, 8, bit(i))
+        for i in range(8, 15):
+            self.set_function(8, size - 15 + i, bit(i))
+        self.set_function(8, size - 8, True)
+
+    def draw_version(self):
+        if self.version < 7:
+            return
+        rem = self.version
+        for _ in range(12):
+            rem = (rem << 1) ^ ((rem >> 11) * 0x1F25)
+        bits = self.version << 12 | rem
+        for i in range(18):
+            dark = (bits >> i) & 1 != 0
+            a = self.size - 11 + i % 3
+            b = i // 3
+            self.set_function(a, b, dark)
+            self.set_function(b, a, dark)
+
+    def draw_codewords(self, data: List[int]):
+        size = self.size
+        i = 0
+        total_bits = len(data) * 8
+        right = size - 1
+        while right >= 1:
+            if right == 6:
+                right = 5
+            upward = ((right + 1) & 2) == 0
+            for vert in range(size):
+                y = size - 1 - vert if upward else vert
+                for j in range(2):
+                    x = right - j
+                    if not self.is_function[y][x] and i < total_bits:
+                        self.modules[y][x] = (data[i >> 3] >> (7 - (i & 7))) & 1 != 0
+                        i += 1
+            right -= 2
+
+    def apply_mask(self, mask: int):
+        condition = _MASKS[mask]
+        for y in range(self.size):
+            row = self.modules[y]
+            function_row = self.is_function[y]
+            for x in range(self.size):
+                if not function_row[x] and condition(x, y):
+                    row[x] = not row[x]
+
+    def penalty(self) -> int:
+        size = self.size
+        modules = self.modules
+        score = 0
+        lines = modules + [list(column) for column in zip(*modules)]
+        for line in lines:
+            # Правило 1: серии одного цвета длиной 5 и более
+            run = 1
+            for i in range(1, size):
+                if line[i] == line[i - 1]:
+                    run += 1
+                else:
+                    if run >= 5:
+                        score += run - 2
+                    run = 1
+            if run >= 5:
+                score += run - 2
+            # Правило 3: шаблоны, похожие на поисковый узор (с учетом светлой рамки)
+            padded = (0,) * 4 + tuple(int(m) for m in line) + (0,) * 4
+            for i in range(len(padded) - 10):
+                if padded[i:i + 11] in _FINDER_LIKE:
+                    score += 40
+        # Правило 2: блоки 2x2 одного цвета
+        for y in range(size - 1):
+            upper, lower = modules[y], modules[y + 1]
+            for x in range(size - 1):
+                if upper[x] == upper[x + 1] == lower[x] == lower[x + 1]:
+                    score += 3
+        # Правило 4: доля темных модулей
+        dark = sum(sum(row) for row in modules)
+        total = size * size
+        score += ((abs(dark * 20 - total * 10) + total - 1) // total - 1) * 10
+        return score
+
+
+def encode(data: bytes, ecl: str = "M", mask: Optional[int] = None) -> List[List[bool]]:
+    """Возвращает матрицу модулей QR-кода (True - темный модуль)"""
+    if ecl not in _FORMAT_BITS:
+        raise ValueError("Уровень коррекции должен быть одним из L, M, Q, H")
+    version, codewords = _encode_codewords(data, ecl)
+    matrix = _Matrix(version, ecl)
+    matrix.draw_function_patterns()
+    matrix.draw_codewords(_add_ecc_and_interleave(codewords, version, ecl))
+
+    if mask is None:
+        best_penalty = None
+        for candidate in range(8):
+            matrix.apply_mask(candidate)
+            matrix.draw_format_bits(candidate)
+            penalty = matrix.penalty()
+            if best_penalty is None or penalty < best_penalty:
+                mask, best_penalty = candidate, penalty
+            matrix.apply_mask(candidate)  # XOR: повторное применение снимает маску
+    matrix.apply_mask(mask)
+    matrix.draw_format_bits(mask)
+    return matrix.modules
+
+
+def _png_chunk(kind: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I", len(payload)) + kind + payload + struct.pack(">I", zlib.crc32(kind + payload) & 0xFFFFFFFF)
+
+
+def render_png(modules: List[List[bool]], size: int = 300, margin: int = 4) -> bytes:
+    """Монохромный PNG (1 бит на пиксель); size - желаемая ширина в пикселях"""
+    count = len(modules) + margin * 2
+    scale = max(1, size // count)
+    width = count * scale
+
+    rows = []
+    for y in range(count):
+        my = y - margin
+        bits = []
+        for x in range(count):
+            mx = x - margin
+            dark = 0 <= my < len(modules) and 0 <= mx < len(modules) and modules[my][mx]
+            bits.extend(("0" if dark else "1") * scale)
+        bits.append("1" * (-len(bits) % 8))
+        line = "".join(bits)
+        row = b"\x00" + int(line, 2).to_bytes(len(line) // 8, "big")
+        rows.extend([row] * scale)
+
+    header = struct.pack(">IIBBBBB", width, width, 1, 0, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + _png_chunk(b"IHDR", header)
+        + _png_chunk(b"IDAT", zlib.compress(b"".join(rows), 9))
+        + _png_chunk(b"IEND", b"")
+    )
+
+
+def render_svg(modules: List[List[bool]], size: int = 300, margin: int = 4) -> bytes:
+    """SVG с одним path; соседние темные модули в строке объединяются"""
+    count = len(modules) + margin * 2
+    parts = []
+    for y, row in enumerate(modules):
+        x = 0
+        while x < len(row):
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < len(row) and row[x]:
+                x += 1
+            parts.append(f"M{start + margin},{y + margin}h{x - start}v1h-{x - start}z")
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" '
+        f'viewBox="0 0 {count} {count}" shape-rendering="crispEdges">'
+        f'<rect width="100%" height="100%" fill="#fff"/>'
+        f'<path fill="#000" d="{"".join(parts)}"/></svg>'
+    ).encode("ascii")
+
+
+QR_MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+
+def render(data: str, fmt: str = "png", size: int = 300, ecl: str = "M", margin: int = 4) -> bytes:
+    modules = encode(data.encode("utf-8"), ecl)
+    if fmt == "svg":
+        return render_svg(modules, size, margin)
+    return render_png(modules, size, margin)
+
+
+class RenderCache:
+    """LRU-кеш готовых изображений, адресуемый хешем параметров.
+
+    Ключ одновременно служит строгим ETag: одинаковые параметры всегда дают
+    одинаковые байты, поэтому повторный запрос не кодирует QR-код заново.
+    """
+
+    def __init__(self, maxsize: int = QR_CACHE_SIZE, max_bytes: int = QR_CACHE_MAX_BYTES):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._bytes = 0
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(data: str, fmt: str, size: int, ecl: str, margin: int) -> str:
+        raw = "\x00".join((data, fmt, str(size), ecl, str(margin))).encode("utf-8")
+        return hashlib.sha256(raw).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key: str, body: bytes):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = body
+            self._bytes += len(body)
+            while len(self._entries) > self.maxsize or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "bytes": self._bytes,
+                "maxsize": self.maxsize,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
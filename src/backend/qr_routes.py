@@ -0,0 +1,80 @@
+"""Публичные маршруты QR-кодов: переход по коду и рендеринг изображения.
+
+Общие для main_app и облегченного serverless-приложения (serverless.py),
+поэтому модуль не тянет ни авторизацию, ни админку.
+"""
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import RedirectResponse, Response
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+
+import qr_render
+from profile_cache import etag_matches
+
+
+async def qr_image_response(image_cache: qr_render.RenderCache, request: Request, data: str, fmt: str, size: int, ecl: str, margin: int, cache_control: str):
+    """Отдает PNG/SVG из кеша; ETag - хеш параметров, поэтому 304 не требует рендеринга"""
+    ecl = ecl.upper()
+    if fmt not in qr_render.QR_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Поддерживаются форматы png и svg")
+    if ecl not in qr_render.ERROR_CORRECTION_LEVELS:
+        raise HTTPException(status_code=400, detail="Уровень коррекции должен быть одним из L, M, Q, H")
+    if not 32 <= size <= qr_render.QR_MAX_IMAGE_SIZE or not 0 <= margin <= qr_render.QR_MAX_MARGIN:
+        raise HTTPException(status_code=400, detail="Недопустимый размер или отступ")
+
+    key = qr_render.RenderCache.key(data, fmt, size, ecl, margin)
+    headers = {"ETag": f'"{key}"', "Cache-Control": cache_control}
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    body = image_cache.get(key)
+    if body is None:
+        try:
+            body = await run_in_threadpool(qr_render.render, data, fmt, size, ecl, margin)
+        except qr_render.QRDataTooLong as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        image_cache.put(key, body)
+    return Response(content=body, media_type=qr_render.QR_MEDIA_TYPES[fmt], headers=headers)
+
+
+def render_router(image_cache: qr_render.RenderCache) -> APIRouter:
+    router = APIRouter()
+
+    @router.get("/api/qr/render")
+    async def qr_render_url(url: str, request: Request, format: str = "png", size: int = 300, ecl: str = "M", margin: int = 4):
+        """Изображение QR-кода для произвольного URL"""
+        if len(url) > 2048:
+            raise HTTPException(status_code=400, detail="Слишком длинный URL")
+        return await qr_image_response(image_cache, request, url, format, size, ecl, margin, "public, max-age=31536000, immutable")
+
+    return router
+
+
+def scan_router(qrcodes_repo, visit_counter, scan_analytics, flush_each_scan: bool = False) -> APIRouter:
+    """Переход по QR-коду: считаем посещение и перенаправляем на страницу.
+
+    flush_each_scan - записывать сканирование в БД сразу после ответа, а не
+    фоновой задачей: у serverless-функции нет lifespan и фоновых задач.
+    """
+    router = APIRouter()
+
+    async def flush_scans():
+        await visit_counter.flush()
+        await scan_analytics.flush()
+
+    @router.get("/q/{qr_id}")
+    async def qr_scan(qr_id: str):
+        qr = await qrcodes_repo.get(qr_id)
+        if qr is None:
+            raise HTTPException(status_code=404, detail="QR-код не найден")
+        visit_counter.record(qr_id)
+        scan_analytics.record(qr_id)
+        # no-store: каждое сканирование должно дойти до сервера
+        return RedirectResponse(
+            qr["url"],
+            status_code=302,
+            headers={"Cache-Control": "no-store"},
+            background=BackgroundTask(flush_scans) if flush_each_scan else None,
+        )
+
+    return router
@@ -0,0 +1,233 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+# Лимиты входа: запросов в минуту и допустимый всплеск
+RATE_LIMIT_IP_PER_MINUTE = float(os.environ.get("RATE_LIMIT_IP_PER_MINUTE", "30"))
+RATE_LIMIT_IP_BURST = float(os.environ.get("RATE_LIMIT_IP_BURST", "10"))
+RATE_LIMIT_USER_PER_MINUTE = float(os.environ.get("RATE_LIMIT_USER_PER_MINUTE", "10"))
+RATE_LIMIT_USER_BURST = float(os.environ.get("RATE_LIMIT_USER_BURST", "5"))
+
+# Ключ, не обращавшийся дольше этого времени, удаляется (его корзина все равно полна)
+RATE_LIMIT_IDLE_TTL = float(os.environ.get("RATE_LIMIT_IDLE_TTL", "600"))
+RATE_LIMIT_MAX_KEYS = int(os.environ.get("RATE_LIMIT_MAX_KEYS", "100000"))
+
+# memory - свой лимит в каждом процессе, sqlite - общий файл для всех воркеров на сервере
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_SQLITE_PATH = os.environ.get("RATE_LIMIT_SQLITE_PATH", "./ratelimit.db")
+
+# За прокси (Render, nginx) адрес клиента берется из X-Forwarded-For
+RATE_LIMIT_TRUST_FORWARDED = os.environ.get("RATE_LIMIT_TRUST_FORWARDED", "false").lower() in ("1", "true", "yes")
+
+
+class RateLimitBackend(ABC):
+    """Хранилище корзин токенов.
+
+    take() списывает токен из корзины key и возвращает 0, если запрос
+    разрешен, иначе - через сколько секунд появится следующий токен.
+    """
+
+    @abstractmethod
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        ...
+
+    def stats(self) -> dict:
+        return {}
+
+
+def _refill(tokens: float, updated: float, now: float, rate: float, burst: float) -> float:
+    return min(burst, tokens + (now - updated) * rate)
+
+
+class MemoryBackend(RateLimitBackend):
+    """Корзины в памяти процесса.
+
+    OrderedDict упорядочен по времени последнего обращения, поэтому
+    простаивающие ключи всегда в начале и удаляются за O(1) на ключ.
+    """
+
+    def __init__(self, idle_ttl: float = RATE_LIMIT_IDLE_TTL, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.idle_ttl = idle_ttl
+        self.max_keys = max_keys
+        self.evictions = 0
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+
+    def _evict(self, now: float):
+        while self._buckets:
+            key, (_, updated) = next(iter(self._buckets.items()))
+            if now - updated < self.idle_ttl and len(self._buckets) <= self.max_keys:
+                break
+            self._buckets.popitem(last=False)
+            self.evictions += 1
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [burst, now]
+            self._buckets[key] = bucket
+            self._evict(now)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = _refill(bucket[0], bucket[1], now, rate, burst)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / rate
+
+    def stats(self) -> dict:
+        return {"backend": "memory", "keys": len(self._buckets), "evictions": self.evictions}
+
+
+class SQLiteBackend(RateLimitBackend):
+    """Общие корзины для нескольких воркеров на одном сервере.
+
+    Локальная замена Redis: каждое списание - короткая транзакция
+    BEGIN IMMEDIATE в отдельном файле SQLite, выполняемая вне event loop.
+    У каждого потока пула свое соединение: транзакции на одном соединении
+    из разных потоков смешиваются.
+    """
+
+    def __init__(self, path: str = RATE_LIMIT_SQLITE_PATH, idle_ttl: float = RATE_LIMIT_IDLE_TTL):
+        self.path = path
+        self.idle_ttl = idle_ttl
+        self._last_sweep = 0.0
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            self._local.conn = conn
+        return conn
+
+    def _take(self, key: str, rate: float, burst: float) -> float:
+        conn = self._connect()
+        # Разные процессы используют одни корзины, поэтому время - по часам системы
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = burst if row is None else _refill(row[0], row[1], now, rate, burst)
+            retry_after = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                retry_after = (1 - tokens) / rate
+            conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)", (key, tokens, now))
+            if now - self._last_sweep >= self.idle_ttl:
+                conn.execute("DELETE FROM buckets WHERE updated < ?", (now - self.idle_ttl,))
+                self._last_sweep = now
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return retry_after
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        return await asyncio.to_thread(self._take, key, rate, burst)
+
+    def stats(self) -> dict:
+        return {"backend": "sqlite", "path": self.path}
+
+
+def create_backend(name: str = RATE_LIMIT_BACKEND) -> RateLimitBackend:
+    if name == "sqlite":
+        return SQLiteBackend()
+    if name == "memory":
+        return MemoryBackend()
+    raise ValueError(f"Неизвестный RATE_LIMIT_BACKEND: {name}")
+
+
+class LoginRateLimiter:
+    """Лимиты попыток входа по IP-адресу и по имени пользователя"""
+
+    def __init__(self, backend: Optional[RateLimitBackend] = None):
+        self.backend = backend or create_backend()
+        self.ip_rate = RATE_LIMIT_IP_PER_MINUTE / 60
+        self.ip_burst = RATE_LIMIT_IP_BURST
+        self.user_rate = RATE_LIMIT_USER_PER_MINUTE / 60
+        self.user_burst = RATE_LIMIT_USER_BURST
+        self.limited_ip = 0
+        self.limited_user = 0
+
+    async def check_ip(self, ip: str) -> float:
+        retry_after = await self.backend.take("ip:" + ip, self.ip_rate, self.ip_burst)
+        if retry_after:
+            self.limited_ip += 1
+        return retry_after
+
+    async def check_username(self, username: str) -> float:
+        retry_after = await self.backend.take("user:" + username.strip().lower(), self.user_rate, self.user_burst)
+        if retry_after:
+            self.limited_user += 1
+        return retry_after
+
+    def stats(self) -> dict:
+        return {
+            **self.backend.stats(),
+            "limited_ip": self.limited_ip,
+            "limited_user": self.limited_user,
+        }
+
+
+def retry_after_header(retry_after: float) -> str:
+    return str(max(1, int(retry_after + 0.999)))
+
+
+def client_ip(scope) -> str:
+    if RATE_LIMIT_TRUST_FORWARDED:
+        for name, value in scope.get("headers", ()):
+            if name == b"x-forwarded-for":
+                return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+class RateLimitMiddleware:
+    """ASGI-middleware: ограничивает POST на маршруты входа по IP-адресу.
+
+    Проверка выполняется до чтения тела запроса, поэтому при переборе
+    паролей сервер не тратит время ни на разбор тела, ни на проверку пароля.
+    """
+
+    def __init__(self, app, limiter: LoginRateLimiter, paths: Iterable[str]):
+        self.app = app
+        self.limiter = limiter
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        retry_after = await self.limiter.check_ip(client_ip(scope))
+        if not retry_after:
+            await self.app(scope, receive, send)
+            return
+
+        body = json.dumps(
+            {"error": True, "message": "Слишком много попыток входа, попробуйте позже"}, ensure_ascii=False
+        ).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                (b"retry-after", retry_after_header(retry_after).encode("latin-1")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,252 @@
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select, update
+
+import models
+
+# Кеш чтения репозиториев. TTL ограничивает устаревание данных, измененных
+# другими воркерами: свои изменения воркер сбрасывает из кеша сразу
+REPO_CACHE_SIZE = int(os.environ.get("REPO_CACHE_SIZE", "10000"))
+REPO_CACHE_TTL = float(os.environ.get("REPO_CACHE_TTL", "30"))
+REPO_YIELD_PER = 1000
+
+_MISSING = object()
+
+
+class ReadThroughCache:
+    """LRU-кеш с TTL; хранит и отсутствие записи, чтобы повторные 404 не шли в БД"""
+
+    def __init__(self, maxsize: int = REPO_CACHE_SIZE, ttl: float = REPO_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Any, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key) -> Any:
+        """Значение (возможно None) или _MISSING, если его нужно прочитать из БД"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                self.misses += 1
+                return _MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+class UserRepository(ABC):
+    """Хранилище пользователей; записи - словари с полями User/UserInDB из main_app"""
+
+    @abstractmethod
+    async def get(self, username: str, fresh: bool = False) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def add(self, record: dict) -> dict:
+        ...
+
+    @abstractmethod
+    async def set_password(self, username: str, hashed_password: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def count(self) -> int:
+        ...
+
+    @abstractmethod
+    def iter_all(self) -> AsyncIterator[dict]:
+        ...
+
+
+class QRCodeRepository(ABC):
+    """Хранилище QR-кодов; записи - словари (id, owner, url, title, created_at)"""
+
+    @abstractmethod
+    async def get(self, qr_id: str, fresh: bool = False) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def add_many(self, records: List[dict]):
+        ...
+
+    @abstractmethod
+    async def list(self, owner: Optional[str] = None) -> List[dict]:
+        ...
+
+    @abstractmethod
+    async def count(self) -> int:
+        ...
+
+    @abstractmethod
+    def iter_all(self) -> AsyncIterator[dict]:
+        ...
+
+
+def user_record(user: models.User) -> dict:
+    return {
+        "username": user.username,
+        "full_name": user.name,
+        "email": user.email,
+        "hashed_password": user.hashed_password,
+        "disabled": bool(user.disabled),
+        "is_admin": bool(user.is_admin),
+    }
+
+
+def qr_record(qr: models.QRCode) -> dict:
+    return {
+        "id": qr.slug,
+        "owner": qr.owner,
+        "url": qr.url,
+        "title": qr.title,
+        "created_at": qr.created_at.strftime("%Y-%m-%d") if qr.created_at else None,
+    }
+
+
+def _parse_date(value) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    if value:
+        return datetime.fromisoformat(value)
+    return datetime.utcnow()
+
+
+class SQLUserRepository(UserRepository):
+    def __init__(self, session_factory, cache: Optional[ReadThroughCache] = None):
+        self.session_factory = session_factory
+        self.cache = cache if cache is not None else ReadThroughCache()
+
+    async def get(self, username: str, fresh: bool = False) -> Optional[dict]:
+        if not fresh:
+            record = self.cache.get(username)
+            if record is not _MISSING:
+                return record
+        async with self.session_factory() as db:
+            result = await db.execute(select(models.User).where(models.User.username == username))
+            user = result.scalars().first()
+        record = user_record(user) if user else None
+        self.cache.put(username, record)
+        return record
+
+    async def add(self, record: dict) -> dict:
+        async with self.session_factory() as db:
+            user = models.User(
+                username=record["username"],
+                name=record.get("full_name"),
+                email=record.get("email"),
+                hashed_password=record["hashed_password"],
+                is_admin=bool(record.get("is_admin")),
+                disabled=bool(record.get("disabled")),
+            )
+            db.add(user)
+            await db.commit()
+            record = user_record(user)
+        self.cache.invalidate(record["username"])
+        return record
+
+    async def set_password(self, username: str, hashed_password: str) -> bool:
+        async with self.session_factory() as db:
+            result = await db.execute(
+                update(models.User).where(models.User.username == username).values(hashed_password=hashed_password)
+            )
+            await db.commit()
+        self.cache.invalidate(username)
+        return result.rowcount > 0
+
+    async def count(self) -> int:
+        async with self.session_factory() as db:
+            return await db.scalar(select(func.count(models.User.id)))
+
+    async def iter_all(self) -> AsyncIterator[dict]:
+        async with self.session_factory() as db:
+            query = select(models.User).order_by(models.User.id).execution_options(yield_per=REPO_YIELD_PER)
+            result = await db.stream(query)
+            async for user in result.scalars():
+                yield user_record(user)
+
+
+class SQLQRCodeRepository(QRCodeRepository):
+    def __init__(self, session_factory, cache: Optional[ReadThroughCache] = None):
+        self.session_factory = session_factory
+        self.cache = cache if cache is not None else ReadThroughCache()
+
+    async def get(self, qr_id: str, fresh: bool = False) -> Optional[dict]:
+        if not fresh:
+            record = self.cache.get(qr_id)
+            if record is not _MISSING:
+                return record
+        async with self.session_factory() as db:
+            result = await db.execute(select(models.QRCode).where(models.QRCode.slug == qr_id))
+            qr = result.scalars().first()
+        record = qr_record(qr) if qr else None
+        self.cache.put(qr_id, record)
+        return record
+
+    async def add_many(self, records: List[dict]):
+        """Добавляет записи одной транзакцией: либо все, либо ни одной"""
+        async with self.session_factory() as db:
+            db.add_all([
+                models.QRCode(
+                    slug=record["id"],
+                    owner=record["owner"],
+                    url=record["url"],
+                    title=record.get("title"),
+                    created_at=_parse_date(record.get("created_at")),
+                )
+                for record in records
+            ])
+            await db.commit()
+        for record in records:
+            self.cache.invalidate(record["id"])
+
+    async def list(self, owner: Optional[str] = None) -> List[dict]:
+        query = select(models.QRCode).order_by(models.QRCode.id)
+        if owner is not None:
+            query = query.where(models.QRCode.owner == owner)
+        async with self.session_factory() as db:
+            result = await db.execute(query)
+            return [qr_record(qr) for qr in result.scalars()]
+
+    async def count(self) -> int:
+        async with self.session_factory() as db:
+            return await db.scalar(select(func.count(models.QRCode.id)))
+
+    async def iter_all(self) -> AsyncIterator[dict]:
+        async with self.session_factory() as db:
+            query = select(models.QRCode).order_by(models.QRCode.id).execution_options(yield_per=REPO_YIELD_PER)
+            result = await db.stream(query)
+            async for qr in result.scalars():
+                yield qr_record(qr)
@@ -1,4 +1,5 @@
 import uvicorn
 
+# Сервер для разработки с автоперезагрузкой; в продакшне используется serve.py
 if __name__ == "__main__":
-    uvicorn.run("main_app:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
+    uvicorn.run("main_app:app", host="0.0.0.0", port=8000, reload=True)
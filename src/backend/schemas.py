@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Literal
 from datetime import datetime
 
 # Схемы для Widget
@@ -24,6 +24,25 @@ class WidgetUpdate(BaseModel):
     height: Optional[float] = None
     anchor: Optional[str] = None
 
+class WidgetPatchOperation(BaseModel):
+    """Операция над контентом в духе JSON Patch: путь - JSON Pointer по ключам объектов"""
+    op: Literal["add", "replace", "remove"]
+    path: str
+    value: Any = None
+
+class WidgetPatch(WidgetUpdate):
+    """Частичное изменение: поля виджета и операции над контентом вместо всего контента"""
+    content_patch: List[WidgetPatchOperation] = []
+
+class WidgetBatchUpdate(WidgetUpdate):
+    id: int
+
+class WidgetBatch(BaseModel):
+    """Пакет изменений страницы конструктора, применяется одной транзакцией"""
+    create: List[WidgetCreate] = []
+    update: List[WidgetBatchUpdate] = []
+    delete: List[int] = []
+
 class Widget(WidgetBase):
     id: int
     created_at: datetime
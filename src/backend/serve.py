@@ -0,0 +1,144 @@
+"""Запуск API в продакшне: несколько воркеров на все ядра контейнера.
+
+Если установлен gunicorn, приложение загружается один раз в мастер-процессе
+(preload) и форкается в воркеры UvicornWorker: код и неизменяемые данные
+общие для всех процессов. Без gunicorn воркеры запускает сам uvicorn.
+uvloop и httptools используются, если установлены.
+
+При остановке (SIGTERM) каждый воркер выполняет shutdown lifespan, то есть
+записывает в БД накопленные сканирования и статистику, в пределах
+SERVER_GRACEFUL_TIMEOUT секунд.
+"""
+import asyncio
+import importlib
+import importlib.util
+import inspect
+import os
+
+import uvicorn
+
+SERVER_APP = os.environ.get("SERVER_APP", "main_app:app")
+SERVER_HOST = os.environ.get("HOST", "0.0.0.0")
+SERVER_PORT = int(os.environ.get("PORT", "8000"))
+SERVER_KEEPALIVE = int(os.environ.get("SERVER_KEEPALIVE", "5"))
+SERVER_BACKLOG = int(os.environ.get("SERVER_BACKLOG", "2048"))
+SERVER_LIMIT_CONCURRENCY = int(os.environ.get("SERVER_LIMIT_CONCURRENCY", "0")) or None
+SERVER_MAX_REQUESTS = int(os.environ.get("SERVER_MAX_REQUESTS", "0")) or None
+SERVER_GRACEFUL_TIMEOUT = int(os.environ.get("SERVER_GRACEFUL_TIMEOUT", "30"))
+SERVER_PRELOAD = os.environ.get("SERVER_PRELOAD", "true").lower() in ("1", "true", "yes")
+SERVER_LOG_LEVEL = os.environ.get("SERVER_LOG_LEVEL", "info")
+
+
+def available_cpus() -> int:
+    """Ядра, доступные процессу (учитывает ограничение affinity в контейнере)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def worker_count() -> int:
+    # WEB_CONCURRENCY - общепринятая переменная (Render, Heroku, gunicorn)
+    workers = int(os.environ.get("WEB_CONCURRENCY", "0"))
+    return workers if workers > 0 else available_cpus()
+
+
+def has_module(name: str) -> bool:
+    return importlib.util.find_spec(name) is not None
+
+
+def uvicorn_options() -> dict:
+    options = {
+        "loop": "uvloop" if has_module("uvloop") else "asyncio",
+        "http": "httptools" if has_module("httptools") else "h11",
+        "lifespan": "on",
+        "timeout_keep_alive": SERVER_KEEPALIVE,
+        "backlog": SERVER_BACKLOG,
+        "limit_concurrency": SERVER_LIMIT_CONCURRENCY,
+        "limit_max_requests": SERVER_MAX_REQUESTS,
+        "log_level": SERVER_LOG_LEVEL,
+        "proxy_headers": True,
+    }
+    # timeout_graceful_shutdown есть только в новых версиях uvicorn
+    if "timeout_graceful_shutdown" in inspect.signature(uvicorn.Config.__init__).parameters:
+        options["timeout_graceful_shutdown"] = SERVER_GRACEFUL_TIMEOUT
+    return options
+
+
+def load_app():
+    module_name, _, attribute = SERVER_APP.partition(":")
+    module = importlib.import_module(module_name)
+    return getattr(module, attribute or "app")
+
+
+def prepare(app):
+    """Один раз прогоняет startup/shutdown приложения до запуска воркеров.
+
+    Таблицы и начальные данные создаются здесь, а не наперегонки в каждом
+    воркере. Соединения с БД закрываются до fork, чтобы воркеры их не делили.
+    """
+    import database
+    import migrate
+
+    migrate.run()
+
+    async def run_lifespan():
+        async with app.router.lifespan_context(app):
+            pass
+        await database.async_engine.dispose()
+
+    asyncio.run(run_lifespan())
+    database.engine.dispose()
+
+
+def run_gunicorn(workers: int):
+    from gunicorn.app.base import BaseApplication
+    from uvicorn.workers import UvicornWorker
+
+    options = uvicorn_options()
+
+    class Worker(UvicornWorker):
+        # Параметры uvicorn, которые gunicorn сам не передает
+        CONFIG_KWARGS = {
+            "loop": options["loop"],
+            "http": options["http"],
+            "lifespan": "on",
+            "limit_concurrency": options["limit_concurrency"],
+        }
+
+    class Application(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{SERVER_HOST}:{SERVER_PORT}")
+            self.cfg.set("workers", workers)
+            self.cfg.set("worker_class", Worker)
+            self.cfg.set("preload_app", SERVER_PRELOAD)
+            self.cfg.set("keepalive", SERVER_KEEPALIVE)
+            self.cfg.set("backlog", SERVER_BACKLOG)
+            self.cfg.set("graceful_timeout", SERVER_GRACEFUL_TIMEOUT)
+            self.cfg.set("timeout", max(SERVER_GRACEFUL_TIMEOUT * 2, 60))
+            self.cfg.set("loglevel", SERVER_LOG_LEVEL)
+            if SERVER_MAX_REQUESTS:
+                self.cfg.set("max_requests", SERVER_MAX_REQUESTS)
+                self.cfg.set("max_requests_jitter", SERVER_MAX_REQUESTS // 10)
+
+        def load(self):
+            return load_app()
+
+    Application().run()
+
+
+def run_uvicorn(workers: int):
+    uvicorn.run(SERVER_APP, host=SERVER_HOST, port=SERVER_PORT, workers=workers, **uvicorn_options())
+
+
+def main():
+    workers = worker_count()
+    prepare(load_app())
+    if has_module("gunicorn") and os.name != "nt":
+        run_gunicorn(workers)
+    else:
+        run_uvicorn(workers)
+
+
+if __name__ == "__main__":
+    main()
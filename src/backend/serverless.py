@@ -0,0 +1,90 @@
+"""Облегченное приложение для serverless-функций (Vercel).
+
+Полный main_app при холодном старте импортирует авторизацию, админку,
+passlib, jose и пул процессов рендеринга, хотя функция обслуживает только
+публичные маршруты. create_app() подключает лишь перечисленные группы
+маршрутов, и каждая группа импортирует свои зависимости сама: функции
+рендеринга QR-кодов не нужен даже SQLAlchemy.
+
+Группы задаются через SERVERLESS_ROUTES (через запятую):
+    health - GET /
+    render - GET /api/qr/render
+    scan   - GET /q/{qr_id} (БД; схема создается заранее: python migrate.py)
+
+Документация OpenAPI не подключается: ее схема строится при первом запросе
+и в функции не нужна.
+"""
+import os
+from typing import Callable, Dict, Iterable, Optional
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
+
+from cors import CORSMiddleware
+from fast_json import FastJSONResponse
+
+SERVERLESS_ROUTES = os.environ.get("SERVERLESS_ROUTES", "health,render,scan")
+
+
+def mount_health(app: FastAPI):
+    @app.get("/")
+    def root():
+        return {"message": "SocialQR API работает!"}
+
+
+def mount_render(app: FastAPI):
+    import qr_render
+    import qr_routes
+
+    app.include_router(qr_routes.render_router(qr_render.RenderCache()))
+
+
+def mount_scan(app: FastAPI):
+    import qr_routes
+    from analytics import ScanAnalytics
+    from database import AsyncSessionLocal, get_async_engine
+    from repository import SQLQRCodeRepository
+    from visits import VisitCounter
+
+    # Движок создается при первом переходе, сканирования пишутся в БД сразу после ответа
+    app.include_router(qr_routes.scan_router(
+        SQLQRCodeRepository(AsyncSessionLocal),
+        VisitCounter(get_async_engine),
+        ScanAnalytics(get_async_engine),
+        flush_each_scan=True,
+    ))
+
+
+ROUTE_GROUPS: Dict[str, Callable[[FastAPI], None]] = {
+    "health": mount_health,
+    "render": mount_render,
+    "scan": mount_scan,
+}
+
+
+def create_app(routes: Optional[Iterable[str]] = None) -> FastAPI:
+    """Приложение только с указанными группами маршрутов (по умолчанию SERVERLESS_ROUTES)"""
+    if routes is None:
+        routes = SERVERLESS_ROUTES.split(",")
+    groups = [name.strip() for name in routes if name.strip()]
+    unknown = [name for name in groups if name not in ROUTE_GROUPS]
+    if unknown:
+        raise ValueError(f"Неизвестные группы маршрутов: {', '.join(unknown)}")
+
+    app = FastAPI(
+        title="SocialQR API",
+        default_response_class=FastJSONResponse,
+        openapi_url=None,
+        docs_url=None,
+        redoc_url=None,
+    )
+    app.add_middleware(CORSMiddleware)
+
+    # Ошибки в том же формате, что и у main_app
+    @app.exception_handler(HTTPException)
+    async def http_exception_handler(request: Request, exc: HTTPException):
+        return JSONResponse(status_code=exc.status_code, content={"error": True, "message": exc.detail})
+
+    for name in groups:
+        ROUTE_GROUPS[name](app)
+    return app
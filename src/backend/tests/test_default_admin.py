@@ -0,0 +1,68 @@
+"""Вход администратором по умолчанию в БД, где администратор уже есть.
+
+Запуск из src/backend:
+    python -m unittest discover tests
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+class DefaultAdminLoginTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.TemporaryDirectory()
+        cls.cwd = os.getcwd()
+        # Файлы, которые приложение создает в текущем каталоге, остаются во временном
+        os.chdir(cls.dir.name)
+        cls.db_path = os.path.join(cls.dir.name, "socialqr.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{cls.db_path}"
+
+        # Администратор, как его создает main.py.fixed и как он хранится в поставляемой БД
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import Session
+
+        import models
+
+        engine = create_engine(os.environ["DATABASE_URL"])
+        models.create_schema(engine)
+        with Session(engine) as session:
+            admin = models.User(username="admin", name="Администратор", is_admin=True)
+            admin.set_password("admin123")
+            session.add(admin)
+            session.commit()
+        engine.dispose()
+
+    @classmethod
+    def tearDownClass(cls):
+        os.chdir(cls.cwd)
+        os.environ.pop("DATABASE_URL", None)
+        cls.dir.cleanup()
+
+    def test_default_credential_works_with_existing_admin(self):
+        from fastapi.testclient import TestClient
+
+        import main_app
+        from hashing import get_pwd_context
+
+        with TestClient(main_app.app) as client:
+            response = client.post("/api/auth/login", json={"username": "admin", "password": "admin"})
+        body = response.json()
+        self.assertFalse(body["error"], body)
+        self.assertEqual(body["user"]["username"], "admin")
+        self.assertTrue(body["user"]["is_admin"])
+
+        # Пароль заменен в самой БД, а не только подставлен при входе
+        with sqlite3.connect(self.db_path) as conn:
+            (hashed,) = conn.execute("SELECT hashed_password FROM users WHERE username = 'admin'").fetchone()
+        self.assertTrue(get_pwd_context().verify("admin", hashed))
+        self.assertFalse(get_pwd_context().verify("admin123", hashed))
+
+
+if __name__ == "__main__":
+    unittest.main()
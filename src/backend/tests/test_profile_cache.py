@@ -0,0 +1,75 @@
+"""Сброс кеша публичных страниц во время построения ответа.
+
+Запуск из src/backend:
+    python -m unittest discover tests
+"""
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from profile_cache import ProfileCache
+
+
+class ProfileCacheInvalidationTest(unittest.TestCase):
+    def test_waiter_does_not_cache_page_built_before_invalidate(self):
+        async def scenario():
+            cache = ProfileCache()
+            first_started = asyncio.Event()
+            release_first = asyncio.Event()
+            second_started = asyncio.Event()
+            release_second = asyncio.Event()
+
+            async def build_first():
+                first_started.set()
+                await release_first.wait()
+                return b"old"
+
+            async def build_second():
+                second_started.set()
+                await release_second.wait()
+                return b"stale"
+
+            first = asyncio.ensure_future(cache.get_or_build("alice", build_first))
+            await first_started.wait()
+            # Второй запрос ждет замок, пока первый строит ответ
+            second = asyncio.ensure_future(cache.get_or_build("alice", build_second))
+            await asyncio.sleep(0)
+            # Сброс во время первого построения: его результат не кешируется
+            cache.invalidate("alice")
+            release_first.set()
+            await first
+
+            await second_started.wait()
+            # Сброс во время построения ожидавшим запросом
+            cache.invalidate("alice")
+            release_second.set()
+            await second
+            return cache
+
+        cache = asyncio.run(scenario())
+        self.assertIsNone(cache.get("alice"))
+        self.assertEqual(cache._locks, {})
+        self.assertEqual(cache._generations, {})
+
+    def test_concurrent_misses_build_once(self):
+        calls = []
+
+        async def build():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return b"page"
+
+        async def scenario():
+            cache = ProfileCache()
+            return await asyncio.gather(*(cache.get_or_build("bob", build) for _ in range(20)))
+
+        results = asyncio.run(scenario())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual({body for body, _ in results}, {b"page"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+"""Конкурентные списания из корзин SQLiteBackend.
+
+Запуск из src/backend:
+    python -m unittest discover tests
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limit import MemoryBackend, RateLimitBackend, SQLiteBackend
+
+
+class SQLiteBackendConcurrencyTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.backend = SQLiteBackend(os.path.join(self.dir.name, "ratelimit.db"))
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_concurrent_takes_do_not_fail(self):
+        async def burst():
+            calls = [self.backend.take(f"ip:{index % 50}", 1.0, 10) for index in range(5000)]
+            return await asyncio.gather(*calls, return_exceptions=True)
+
+        results = asyncio.run(burst())
+        errors = [result for result in results if isinstance(result, BaseException)]
+        self.assertEqual(errors, [])
+
+    def test_concurrent_takes_spend_burst_exactly_once(self):
+        # Скорость пополнения почти нулевая: разрешено ровно burst списаний
+        async def burst():
+            return await asyncio.gather(*(self.backend.take("user:admin", 1e-9, 100) for _ in range(1000)))
+
+        results = asyncio.run(burst())
+        self.assertEqual(sum(1 for retry_after in results if retry_after == 0), 100)
+
+
+class RateLimitBackendTest(unittest.TestCase):
+    def test_incomplete_backend_cannot_be_created(self):
+        class Incomplete(RateLimitBackend):
+            pass
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+        MemoryBackend()
+
+
+if __name__ == "__main__":
+    unittest.main()
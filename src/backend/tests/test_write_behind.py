@@ -0,0 +1,30 @@
+"""Буферы с отложенной записью.
+
+Запуск из src/backend:
+    python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics import ScanAnalytics
+from visits import VisitCounter, WriteBehindBuffer
+
+
+class WriteBehindBufferTest(unittest.TestCase):
+    def test_buffer_without_flush_cannot_be_created(self):
+        class Incomplete(WriteBehindBuffer):
+            pass
+
+        with self.assertRaises(TypeError):
+            Incomplete(lambda: None, interval=1, threshold=1)
+
+    def test_buffers_implement_flush(self):
+        VisitCounter(lambda: None)
+        ScanAnalytics(lambda: None)
+
+
+if __name__ == "__main__":
+    unittest.main()
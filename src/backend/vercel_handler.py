@@ -1,10 +1,12 @@
-from main import app
+from serverless import create_app
 import os
 
-# Функция-обработчик для Vercel serverless функций
+# Функция-обработчик для Vercel serverless функций: подключаются только
+# маршруты из SERVERLESS_ROUTES, тяжелые модули грузятся по необходимости
+app = create_app()
 handler = app
  
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 8000))
-    uvicorn.run("main:app", host="0.0.0.0", port=port) 
\ No newline at end of file
+    uvicorn.run("vercel_handler:app", host="0.0.0.0", port=port)
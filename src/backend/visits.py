@@ -0,0 +1,257 @@
+import asyncio
+import os
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Optional, Union
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+import models
+
+# Настройки записи посещений
+VISITS_FLUSH_INTERVAL = float(os.environ.get("VISITS_FLUSH_INTERVAL", "5"))
+VISITS_FLUSH_THRESHOLD = int(os.environ.get("VISITS_FLUSH_THRESHOLD", "1000"))
+# Сколько секунд прочитанные из БД значения считаются актуальными:
+# другие воркеры записывают свои сканирования с тем же интервалом
+VISITS_REFRESH_INTERVAL = float(os.environ.get("VISITS_REFRESH_INTERVAL", str(VISITS_FLUSH_INTERVAL)))
+# Число кодов в одном запросе при чтении счетчиков
+VISITS_REFRESH_BATCH = 500
+
+
+def _insert(dialect: str):
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+def _upsert(dialect: str):
+    """INSERT ... ON CONFLICT для SQLite и PostgreSQL"""
+    table = models.QRVisitCount.__table__
+    statement = _insert(dialect)(table)
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.qr_id],
+        set_={
+            "visits": table.c.visits + statement.excluded.visits,
+            "updated_at": statement.excluded.updated_at,
+        },
+    ).returning(table.c.qr_id, table.c.visits)
+
+
+def _total_upsert(dialect: str, count: int):
+    """Увеличивает общий итог на count и возвращает новое значение"""
+    table = models.QRVisitTotal.__table__
+    statement = _insert(dialect)(table).values(id=models.VISIT_TOTAL_ID, visits=count)
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.id],
+        set_={"visits": table.c.visits + statement.excluded.visits},
+    ).returning(table.c.visits)
+
+
+class WriteBehindBuffer(ABC):
+    """Основа буферов с отложенной записью: фоновая задача вызывает flush()
+    раз в interval секунд или досрочно, когда накопилось threshold событий.
+
+    engine - движок БД или функция без аргументов, создающая его при первой записи.
+    """
+
+    def __init__(self, engine: Union[AsyncEngine, Callable[[], AsyncEngine]], interval: float, threshold: int):
+        self._engine = engine
+        self.interval = interval
+        self.threshold = threshold
+        self.flushes = 0
+        self.flush_errors = 0
+        self._pending_count = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    @property
+    def engine(self) -> AsyncEngine:
+        if not isinstance(self._engine, AsyncEngine):
+            self._engine = self._engine()
+        return self._engine
+
+    def _added(self, count: int):
+        self._pending_count += count
+        if self._wakeup is not None and self._pending_count >= self.threshold:
+            self._wakeup.set()
+
+    async def load(self):
+        """Начальное состояние из БД (по умолчанию ничего не читается)"""
+
+    @abstractmethod
+    async def flush(self):
+        """Записывает накопленные данные в БД"""
+
+    def _requeue_inflight(self):
+        """Возвращает в буфер данные неудавшейся записи"""
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def start(self):
+        await self.load()
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Останавливает фоновую запись и сбрасывает оставшиеся данные"""
+        if self._task is not None:
+            # Не отменяем задачу: отмена посреди транзакции оставляет соединение
+            # занятым, и последний flush() ждет блокировку БД
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+
+class VisitCounter(WriteBehindBuffer):
+    """Счетчик сканирований с отложенной записью (write-behind).
+
+    Сканирование только увеличивает число в памяти; раз в VISITS_FLUSH_INTERVAL
+    секунд (или после VISITS_FLUSH_THRESHOLD сканирований) накопленные приращения
+    записываются в БД одним пакетным UPSERT. Той же транзакцией увеличивается
+    строка общего итога, и RETURNING возвращает новые значения, поэтому
+    чтение итогов - O(1) и не требует суммирования по таблице.
+
+    Сканирования кодов пишут и другие воркеры: значения старше
+    VISITS_REFRESH_INTERVAL секунд перечитываются из БД через refresh().
+    """
+
+    def __init__(
+        self,
+        engine,
+        interval: float = VISITS_FLUSH_INTERVAL,
+        threshold: int = VISITS_FLUSH_THRESHOLD,
+        refresh_interval: float = VISITS_REFRESH_INTERVAL,
+    ):
+        super().__init__(engine, interval, threshold)
+        self.refresh_interval = refresh_interval
+        # Значения, подтвержденные БД, и приращения, еще не записанные в нее
+        self._stored: Dict[str, int] = {}
+        self._stored_total = 0
+        self._pending: Dict[str, int] = {}
+        self._inflight: Dict[str, int] = {}
+        self._unflushed_total = 0
+        # Когда (time.monotonic) значение кода и общий итог последний раз прочитаны из БД
+        self._checked: Dict[str, float] = {}
+        self._total_checked: Optional[float] = None
+
+    def record(self, qr_id: str, count: int = 1):
+        self._pending[qr_id] = self._pending.get(qr_id, 0) + count
+        self._unflushed_total += count
+        self._added(count)
+
+    def count(self, qr_id: str) -> int:
+        return self._stored.get(qr_id, 0) + self._inflight.get(qr_id, 0) + self._pending.get(qr_id, 0)
+
+    @property
+    def total(self) -> int:
+        return self._stored_total + self._unflushed_total
+
+    def has_stored(self, qr_id: str) -> bool:
+        return qr_id in self._stored
+
+    def _is_fresh(self, checked: Optional[float], now: float) -> bool:
+        return checked is not None and now - checked < self.refresh_interval
+
+    async def refresh(self, qr_ids: Optional[Iterable[str]] = ()):
+        """Перечитывает из БД устаревшие значения указанных кодов и общий итог.
+
+        qr_ids=None - все коды (для выгрузок, которые и так читают все коды).
+        """
+        started = time.monotonic()
+        if qr_ids is None:
+            stale = None
+        else:
+            stale = [qr_id for qr_id in dict.fromkeys(qr_ids) if not self._is_fresh(self._checked.get(qr_id), started)]
+        refresh_total = not self._is_fresh(self._total_checked, started)
+        if stale is not None and not stale and not refresh_total:
+            return
+        table = models.QRVisitCount.__table__
+        rows = []
+        async with self.engine.connect() as conn:
+            if stale is None:
+                rows = (await conn.execute(select(table.c.qr_id, table.c.visits))).all()
+            else:
+                for start in range(0, len(stale), VISITS_REFRESH_BATCH):
+                    batch = stale[start:start + VISITS_REFRESH_BATCH]
+                    query = select(table.c.qr_id, table.c.visits).where(table.c.qr_id.in_(batch))
+                    rows.extend((await conn.execute(query)).all())
+            if refresh_total:
+                totals = models.QRVisitTotal.__table__
+                query = select(totals.c.visits).where(totals.c.id == models.VISIT_TOTAL_ID)
+                stored_total = (await conn.execute(query)).scalar_one_or_none() or 0
+        # Значения, обновленные записью, которая завершилась во время чтения, новее прочитанных
+        for qr_id, visits in rows:
+            if self._checked.get(qr_id, started) <= started:
+                self._stored[qr_id] = visits
+                self._checked[qr_id] = started
+        for qr_id in stale or ():
+            self._checked.setdefault(qr_id, started)
+        if refresh_total and (self._total_checked is None or self._total_checked <= started):
+            self._stored_total = stored_total
+            self._total_checked = started
+
+    async def load(self):
+        """Читает общий итог при старте; счетчики кодов читаются по мере обращения"""
+        await self.refresh()
+
+    async def flush(self):
+        if not self._pending or self._inflight:
+            return
+        self._inflight, self._pending = self._pending, {}
+        self._pending_count = 0
+        now = datetime.utcnow()
+        rows = [{"qr_id": qr_id, "visits": count, "updated_at": now} for qr_id, count in self._inflight.items()]
+        flushed = sum(self._inflight.values())
+        dialect = self.engine.dialect.name
+        try:
+            async with self.engine.begin() as conn:
+                result = await conn.execute(_upsert(dialect), rows)
+                updated = result.all()
+                stored_total = (await conn.execute(_total_upsert(dialect, flushed))).scalar_one()
+        except Exception as e:
+            # Возвращаем приращения в очередь, чтобы записать их в следующий раз
+            self.flush_errors += 1
+            self._requeue_inflight()
+            print(f"Ошибка при записи посещений: {e}")
+            return
+        # RETURNING дает актуальные значения с учетом записей других воркеров
+        checked = time.monotonic()
+        for qr_id, visits in updated:
+            self._stored[qr_id] = visits
+            self._checked[qr_id] = checked
+        self._stored_total = stored_total
+        self._total_checked = checked
+        self._unflushed_total -= flushed
+        self._inflight = {}
+        self.flushes += 1
+
+    def _requeue_inflight(self):
+        for qr_id, count in self._inflight.items():
+            self._pending[qr_id] = self._pending.get(qr_id, 0) + count
+            self._pending_count += count
+        self._inflight = {}
+
+    def stats(self):
+        return {
+            "pending": self._pending_count,
+            "pending_codes": len(self._pending),
+            "total": self.total,
+            "flushes": self.flushes,
+            "flush_errors": self.flush_errors,
+            "interval": self.interval,
+        }
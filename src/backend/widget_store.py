@@ -0,0 +1,134 @@
+"""Частичные изменения и чтение контента виджетов без разбора JSON.
+
+Изменения контента задаются операциями в духе JSON Patch (RFC 6902):
+    [{"op": "replace", "path": "/style/size", "value": 24}, {"op": "remove", "path": "/caption"}]
+add и replace записывают значение по пути, remove удаляет ключ. Пути - JSON
+Pointer по ключам объектов; индексы массивов не поддерживаются, массив
+заменяется целиком по ключу. Если родительского объекта нет, операция
+ничего не меняет.
+
+В SQLite (JSON1) и PostgreSQL (JSONB) операции выполняются одним UPDATE
+в самой БД: контент не читается и не переписывается целиком. Для других БД
+и текстового хранения в PostgreSQL контент меняется в Python.
+
+Списки виджетов читают контент как текст и вставляют его в ответ как есть.
+"""
+import sqlite3
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import Text, case, cast, func, select
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, array
+
+import models
+from fast_json import dumps
+
+# Вложенный путь в SQLite проверяет родителя через CASE и повторяет выражение;
+# патчи с большим числом таких операций применяются в Python
+SQLITE_MAX_NESTED_OPERATIONS = 4
+
+WIDGET_FIELDS = ("id", "type", "position_x", "position_y", "width", "height", "anchor", "created_at", "updated_at", "user_id")
+
+
+class PatchError(ValueError):
+    pass
+
+
+@lru_cache(maxsize=None)
+def sqlite_json1() -> bool:
+    """Есть ли функции JSON1 в библиотеке SQLite (встроены начиная с 3.38)"""
+    try:
+        sqlite3.connect(":memory:").execute("SELECT json_set('{}', '$.a', json('1'))")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def parse_pointer(path: str) -> List[str]:
+    """JSON Pointer -> список ключей"""
+    if not path.startswith("/") or path == "/":
+        raise PatchError(f"Недопустимый путь: {path!r}")
+    return [key.replace("~1", "/").replace("~0", "~") for key in path[1:].split("/")]
+
+
+def parse_operations(operations: Iterable[Any]) -> List[tuple]:
+    """Операции схемы WidgetPatchOperation -> (op, ключи, значение)"""
+    return [(operation.op, parse_pointer(operation.path), operation.value) for operation in operations]
+
+
+def patch_expression(column, operations: List[tuple], dialect_name: str):
+    """SQL-выражение нового контента или None, если БД не умеет менять JSON на месте"""
+    if dialect_name == "sqlite" and sqlite_json1():
+        # Ключи в пути SQLite берутся в кавычки; ключи с кавычками обрабатываются в Python
+        if any('"' in key for _, keys, _ in operations for key in keys):
+            return None
+        if sum(1 for op, keys, _ in operations if op != "remove" and len(keys) > 1) > SQLITE_MAX_NESTED_OPERATIONS:
+            return None
+        expression = func.coalesce(column, "{}")
+        for op, keys, value in operations:
+            path = "$" + "".join(f'."{key}"' for key in keys)
+            if op == "remove":
+                expression = func.json_remove(expression, path)
+                continue
+            updated = func.json_set(expression, path, func.json(dumps(value).decode("utf-8")))
+            if len(keys) > 1:
+                # json_set создает недостающих родителей; как и в PostgreSQL, такая операция ничего не меняет
+                parent = path[:path.rindex('."')]
+                updated = case((func.json_type(expression, parent) == "object", updated), else_=expression)
+            expression = updated
+        return expression
+    if dialect_name == "postgresql" and models.WIDGET_CONTENT_STORAGE != "text":
+        expression = func.coalesce(column, cast("{}", JSONB))
+        for op, keys, value in operations:
+            path = cast(array(keys), ARRAY(Text))
+            if op == "remove":
+                expression = expression.op("#-")(path)
+            else:
+                expression = func.jsonb_set(expression, path, cast(dumps(value).decode("utf-8"), JSONB), True)
+        return expression
+    return None
+
+
+def apply_patch(content: Optional[Dict[str, Any]], operations: List[tuple]) -> Dict[str, Any]:
+    """Те же операции над словарем: для БД без JSON-функций"""
+    content = dict(content or {})
+    for op, keys, value in operations:
+        parent = content
+        for key in keys[:-1]:
+            child = parent.get(key)
+            if not isinstance(child, dict):
+                parent = None
+                break
+            # Вложенные словари копируются, чтобы не менять загруженное значение
+            parent[key] = child = dict(child)
+            parent = child
+        if parent is None:
+            continue
+        if op == "remove":
+            parent.pop(keys[-1], None)
+        else:
+            parent[keys[-1]] = value
+    return content
+
+
+def raw_widgets_query():
+    """Колонки виджета, контент - текстом, без разбора JSON"""
+    return select(
+        *(getattr(models.Widget, field) for field in WIDGET_FIELDS),
+        cast(models.Widget.content, Text).label("content"),
+    )
+
+
+def widget_json(row) -> bytes:
+    """JSON виджета в формате schemas.Widget; контент вставляется как есть"""
+    fields = {}
+    for field in WIDGET_FIELDS:
+        value = getattr(row, field)
+        fields[field] = value.isoformat() if isinstance(value, datetime) else value
+    content = row.content.encode("utf-8") if row.content is not None else b"null"
+    return dumps(fields)[:-1] + b',"content":' + content + b"}"
+
+
+def widgets_json(rows) -> bytes:
+    return b"[" + b",".join(widget_json(row) for row in rows) + b"]"